@@ -0,0 +1,183 @@
+from recorder import ChunkedArray
+import numpy as np
+import math
+
+class TripAnalytics:
+    """
+    Trip statistics kept up to date while a board is simulated, so they never have to be rebuilt
+    from the recorded events. Attach it with TripAnalytics(board); Board.simulate then calls
+    on_update after every timestep, which costs a few array operations over the ants.
+
+    A trip starts when an ant picks up food and ends when it drops it at the colony. For each
+    completed trip a row of COLUMNS is kept in 'trips' (a ChunkedArray, left out with
+    keep_trips=False), and running totals are kept either way:
+    duration: timesteps from the pickup to the drop
+    path_length: length of the path walked home, a diagonal step counting sqrt(2)
+    distance: straight-line distance from where the food was picked up to the ant's colony
+    stuck: timesteps of the trip the ant could not move
+
+    Per ant, 'trips_completed', 'stuck_steps' (over the whole run, with or without food) and
+    'distance_walked' are kept. The colony's throughput, the food dropped per timestep over the
+    last w timesteps for each w of 'windows', is sampled every sample_every timesteps (by
+    default the shortest window) into 'throughput'.
+
+    Trips under way when the analytics are attached are not counted, having no known start.
+    Boards stepped by a StripDecomposition are not followed, as it does not call the observers.
+    """
+    COLUMNS = ("ant", "pickup_t", "deposit_t", "duration", "path_length", "distance", "stuck")
+
+    def __init__(self, board, windows = (100, 1000, 10000), sample_every = None, keep_trips = True, chunk_rows = 65536):
+        num_ants = board.num_ants
+        self.colonies = np.array(board.colonies, dtype=np.int64)
+        self.windows = tuple(sorted(windows))
+        self.sample_every = sample_every or self.windows[0]
+
+        self.trip_start = np.full(num_ants, -1, dtype=np.int64)
+        self.trip_path = np.zeros(num_ants, dtype=np.float64)
+        self.trip_stuck = np.zeros(num_ants, dtype=np.int64)
+        self.trip_distance = np.zeros(num_ants, dtype=np.float64)
+        self.trips_completed = np.zeros(num_ants, dtype=np.int64)
+        self.stuck_steps = np.zeros(num_ants, dtype=np.int64)
+        self.distance_walked = np.zeros(num_ants, dtype=np.float64)
+        self.active_steps = 0
+
+        self.trips = ChunkedArray(len(self.COLUMNS), np.float64, chunk_rows) if keep_trips else None
+        self.totals = dict.fromkeys(("trips", "duration", "path_length", "distance", "stuck", "efficiency"), 0.0)
+
+        # the food dropped in each of the last max(windows) timesteps, and its sum over each window
+        self.ring = np.zeros(self.windows[-1], dtype=np.int64)
+        self.sums = np.zeros(len(self.windows), dtype=np.int64)
+        self.steps = 0
+        self.throughput = ChunkedArray(1 + len(self.windows), np.float64, chunk_rows)
+
+        state = board.ant_state
+        self.y = state.y.copy()
+        self.x = state.x.copy()
+        self.has_food = state.has_food.copy()
+        board.observers.append(self)
+
+    def on_update(self, board):
+        """Called by Board.simulate after each timestep."""
+        state = board.ant_state
+        y, x, has_food = state.y, state.x, state.has_food
+        dy = y != self.y
+        dx = x != self.x
+        moved = dy | dx
+        step = np.where(dy & dx, math.sqrt(2), 1.0) * moved
+        picked = ~self.has_food & has_food
+        dropped = self.has_food & ~has_food
+        stuck = state.activated & ~moved & ~picked & ~dropped
+        self.stuck_steps += stuck
+        self.distance_walked += step
+        self.active_steps += int(np.count_nonzero(state.activated))
+
+        carrying = has_food & ~picked
+        self.trip_path[carrying] += step[carrying]
+        self.trip_stuck[carrying] += stuck[carrying]
+
+        ants = np.flatnonzero(dropped & (self.trip_start >= 0))
+        if len(ants):
+            self.finish_trips(ants, board.t)
+        self.trip_start[dropped] = -1
+
+        ants = np.flatnonzero(picked)
+        if len(ants):
+            self.trip_start[ants] = board.t
+            self.trip_path[ants] = 0
+            self.trip_stuck[ants] = 0
+            home = self.colonies[state.colony[ants]]
+            self.trip_distance[ants] = np.hypot(y[ants] - home[:, 0], x[ants] - home[:, 1])
+
+        self.count_deposits(int(np.count_nonzero(dropped)), board.t)
+        self.y[...] = y
+        self.x[...] = x
+        self.has_food[...] = has_food
+
+    def finish_trips(self, ants, t):
+        """Adds the trips of 'ants', which dropped their food at timestep t, to the trips and totals."""
+        duration = t - self.trip_start[ants]
+        path = self.trip_path[ants]
+        distance = self.trip_distance[ants]
+        stuck = self.trip_stuck[ants]
+        self.trips_completed[ants] += 1
+        self.totals["trips"] += len(ants)
+        self.totals["duration"] += duration.sum()
+        self.totals["path_length"] += path.sum()
+        self.totals["distance"] += distance.sum()
+        self.totals["stuck"] += stuck.sum()
+        self.totals["efficiency"] += (distance / np.maximum(path, 1)).sum()
+        if self.trips is not None:
+            self.trips.append(np.stack([ants, self.trip_start[ants], np.full(len(ants), t), duration, path, distance, stuck], axis=1))
+
+    def count_deposits(self, deposits, t):
+        """Moves every throughput window on by one timestep with 'deposits' food dropped."""
+        slot = self.steps % len(self.ring)
+        for i, window in enumerate(self.windows):
+            if self.steps >= window:
+                self.sums[i] -= self.ring[(self.steps - window) % len(self.ring)]
+        self.sums += deposits
+        self.ring[slot] = deposits
+        self.steps += 1
+        if self.steps % self.sample_every == 0:
+            self.throughput.append([[t, *self.rates()]])
+
+    def rates(self):
+        """The food dropped per timestep over each window (over fewer timesteps until the window has filled)."""
+        return self.sums / np.minimum(self.steps, self.windows).clip(min=1)
+
+    def trip_columns(self):
+        """The completed trips as a dict of arrays, one per column."""
+        if self.trips is None:
+            raise ValueError("The trips were not kept (keep_trips=False).")
+        table = self.trips.to_array()
+        columns = {name: table[:, i] for i, name in enumerate(self.COLUMNS)}
+        for name in ("ant", "pickup_t", "deposit_t", "duration", "stuck"):
+            columns[name] = columns[name].astype(np.int64)
+        return columns
+
+    def ant_columns(self):
+        """The per-ant statistics as a dict of arrays, indexed by ant."""
+        return {"ant": np.arange(len(self.trip_start)), "trips": self.trips_completed.copy(),
+                "stuck_steps": self.stuck_steps.copy(), "distance_walked": self.distance_walked.copy()}
+
+    def throughput_columns(self):
+        """The sampled throughput as a dict of arrays: 't', then 'window_<w>' for each window."""
+        table = self.throughput.to_array()
+        columns = {"t": table[:, 0].astype(np.int64)}
+        for i, window in enumerate(self.windows):
+            columns[f"window_{window}"] = table[:, i + 1]
+        return columns
+
+    def summary(self):
+        """A small dict of the means over all completed trips and the current throughput, for comparing runs."""
+        trips = self.totals["trips"]
+        mean = lambda name: float(self.totals[name] / trips) if trips else math.nan
+        summary = {
+            "trips": int(trips),
+            "mean_duration": mean("duration"),
+            "mean_path_length": mean("path_length"),
+            "mean_distance": mean("distance"),
+            "mean_efficiency": mean("efficiency"),
+            "mean_stuck": mean("stuck"),
+            "stuck_share": int(self.stuck_steps.sum()) / self.active_steps if self.active_steps else math.nan,
+        }
+        for window, rate in zip(self.windows, self.rates()):
+            summary[f"throughput_{window}"] = float(rate)
+        return summary
+
+    def to_csv(self, path, table = "trips"):
+        """Writes one table ("trips", "ants" or "throughput") to a CSV file with a header row."""
+        columns = {"trips": self.trip_columns, "ants": self.ant_columns, "throughput": self.throughput_columns}[table]()
+        formats = ["%d" if np.issubdtype(values.dtype, np.integer) else "%.6g" for values in columns.values()]
+        np.savetxt(path, np.column_stack(list(columns.values())), delimiter=",", header=",".join(columns), comments="", fmt=formats)
+
+    def save(self, path):
+        """Writes every table to one .npz file, as arrays named '<table>/<column>'."""
+        arrays = {}
+        tables = {"ants": self.ant_columns(), "throughput": self.throughput_columns()}
+        if self.trips is not None:
+            tables["trips"] = self.trip_columns()
+        for table, columns in tables.items():
+            for name, values in columns.items():
+                arrays[f"{table}/{name}"] = values
+        np.savez_compressed(path, **arrays)
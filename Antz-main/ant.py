@@ -1,35 +1,136 @@
 from tile import *
+from parameters import Parameters
 import random
+import numpy as np
+
+class AntArrays:
+    """
+    Structure-of-arrays state for a group of ants: position, direction, has_food, activated and
+    colony (the colony the ant belongs to, whose pheromone it follows), one entry per ant. field
+    is the TileField the positions refer to (None for stand-alone ants) and params the
+    Parameters the ants follow.
+
+    draws holds this timestep's (num_ants, 2) uniforms from the board's RandomStream, which the
+    ants use instead of the random module. It is None for stand-alone ants.
+
+    profiler is the board's Profiler, counting what the ants do, or None.
+
+    food is the board's FoodRegistry, which an ant picking up food takes a unit from, or None.
+    """
+    def __init__(self, num_ants, field = None, params = None):
+        self.field = field
+        self.params = params if params is not None else Parameters()
+        self.y = np.zeros(num_ants, dtype=np.int64)
+        self.x = np.zeros(num_ants, dtype=np.int64)
+        self.direction = np.zeros(num_ants, dtype=np.int64)
+        self.has_food = np.zeros(num_ants, dtype=bool)
+        self.activated = np.zeros(num_ants, dtype=bool)
+        self.colony = np.zeros(num_ants, dtype=np.int64)
+        self.draws = None
+        self.profiler = None
+        self.food = None
+
+    def __len__(self):
+        return len(self.y)
 
 class Ant:
     # Ant constructor, creates an at at the given coordinates
     # (We'll use the nest coordinates), and they spawn with no food
-    def __init__(self, tile):
+    # The ant's state lives in entry 'index' of an AntArrays, a stand-alone ant gets its own
+    # Without a given direction, the ant faces a random one
+    def __init__(self, tile, state = None, index = 0, direction = None):
+        if state is None:
+            state = AntArrays(1)
+            index = 0
+        self.state = state
+        self.index = index
+        self._tile = None
+
         self.has_food = False
-        self.direction = random.choice(range(0,8))
+        self.direction = direction if direction is not None else random.choice(range(0,8))
         self.activated = False
         self.current_tile = tile
 
+    @property
+    def has_food(self):
+        return bool(self.state.has_food[self.index])
+
+    @has_food.setter
+    def has_food(self, value):
+        self.state.has_food[self.index] = value
+
+    @property
+    def direction(self):
+        return int(self.state.direction[self.index])
+
+    @direction.setter
+    def direction(self, value):
+        self.state.direction[self.index] = value
+
+    @property
+    def colony(self):
+        return int(self.state.colony[self.index])
+
+    @colony.setter
+    def colony(self, value):
+        self.state.colony[self.index] = value
+
+    @property
+    def activated(self):
+        return bool(self.state.activated[self.index])
+
+    @activated.setter
+    def activated(self, value):
+        self.state.activated[self.index] = value
+
+    # The tile the ant stands on, looked up again if the ant was moved through the arrays
+    @property
+    def current_tile(self):
+        y = self.state.y[self.index]
+        x = self.state.x[self.index]
+        if self.state.field is not None and (self._tile.y != y or self._tile.x != x):
+            self._tile = self.state.field[(int(y), int(x))]
+        return self._tile
+
+    @current_tile.setter
+    def current_tile(self, tile):
+        self._tile = tile
+        self.state.y[self.index] = tile.y
+        self.state.x[self.index] = tile.x
+
+    # This timestep's two uniforms for the ant, or None when it has to use the random module
+    def draws(self):
+        if self.state.draws is None:
+            return None
+        return self.state.draws[self.index]
+
     # Ant picks up food and sets has_food to True
     def pick_up_food (self):
         self.has_food = True
+        if self.state.food is not None:
+            self.state.food.take(self.current_tile.y, self.current_tile.x)
 
     # Ant drops up food and sets has_food to False
     def drop_food (self): 
         self.has_food = False
     
     # Ant leaves the appropriate pheromones depending on whether the ant is looking for food or the colony
+    # (on its own colony's layer)
     def leave_pheromone(self):
+        tile = self.current_tile
+        colony = self.colony
         if self.has_food:
-            self.current_tile.set_home_pheromone(self.current_tile.get_home_pheromone() + 4)
+            tile.set_home_pheromone(tile.get_home_pheromone(colony) + self.state.params.deposit, colony)
         else:
-            self.current_tile.set_food_pheromone(self.current_tile.get_food_pheromone() + 4)
+            tile.set_food_pheromone(tile.get_food_pheromone(colony) + self.state.params.deposit, colony)
     
     # Helper function for ant to move into the given tile and sets its previous tile as unoccupied
     def march(self, tile):
 
         if not self.current_tile.get_is_colony() and not self.current_tile.get_has_food():
             self.leave_pheromone()
+            if self.state.profiler is not None:
+                self.state.profiler.count("deposits")
         if not tile.get_is_colony():
             tile.set_is_occupied(True)
 
@@ -55,25 +156,43 @@ class Ant:
             self.direction += 4
 
         elif (turning_decision == -2):
-            self.direction += random.choice([-1,1])
+            draws = self.draws()
+            if draws is None:
+                self.direction += random.choice([-1,1])
+            else:
+                self.direction += -1 if draws[1] < 0.5 else 1
 
         self.direction = self.direction % 8
 
     # Ant decides which tile it will turn into using the visible tiles' pheromone ranks
+    # With the board's draws, the first uniform picks exploit or explore and the second the tile
     def decide_turning(self, list):
-    
-        if random.random() <= 0.95:
+        draws = self.draws()
+        if draws is None:
+            draws = (random.random(), None)
+
+        exploit = draws[0] <= self.state.params.exploit_probability
+        if exploit:
             max_val = max(list)
-            max_indices = [i for i, weight in enumerate(list) if weight == max_val]
-            return random.choice(max_indices)
+            candidates = [i for i, weight in enumerate(list) if weight == max_val]
         else:
-            return random.choice([i for i, weight in enumerate(list) if weight > 0])
+            candidates = [i for i, weight in enumerate(list) if weight > 0]
+        if self.state.profiler is not None:
+            self.state.profiler.count("exploit" if exploit else "explore")
+        if draws[1] is None:
+            return random.choice(candidates)
+        return candidates[int(draws[1] * len(candidates))]
         # return random.choices([0,1,2], weights = list)[0] Alternative method for choosing which tile to move into
 
     # Ant checks if there's anyting in front of it among the neighboring tiles and moves to a new tile
     def move(self, code, neighboring_tiles):
+        profiler = self.state.profiler
+        if profiler is not None:
+            profiler.count("moves")
         # Ant turns around if all tile are occupied or inaccessible
         if (neighboring_tiles == [None, None, None]):
+            if profiler is not None:
+                profiler.count("blocked_moves")
             self.turn(-2)
             return
         else:
@@ -83,13 +202,13 @@ class Ant:
             # Move into tile the ant is facing if the tile is of the objective the ant is searching for
             for i in [1,0,2]:
                 if (neighboring_tiles[i] != None):
-                    if (neighboring_tiles[i].get_check_method(code)):
+                    if (neighboring_tiles[i].get_check_method(code, self.colony)):
                         self.turn(i)
                         self.march(neighboring_tiles[i])
                         return
                     
                     else:
-                        pheromone_list[i] = neighboring_tiles[i].get_pheromone_method(code)
+                        pheromone_list[i] = neighboring_tiles[i].get_pheromone_method(code, self.colony)
             
             # Semi-randomly move into one of the available tiles based on pheromone level
             turning_direction = self.decide_turning(pheromone_list)
@@ -104,13 +223,17 @@ class Ant:
                 if self.current_tile.get_has_food():
                     self.pick_up_food()
                     self.turn(-1) # turning around
+                    if self.state.profiler is not None:
+                        self.state.profiler.count("turn_arounds")
                     return 0
                 else:
                     self.move(1, neighboring_tiles)
             else:
-                if self.current_tile.get_is_colony():
+                if self.current_tile.colony == self.colony:
                     self.drop_food()
                     self.turn(-1) # turning round
+                    if self.state.profiler is not None:
+                        self.state.profiler.count("turn_arounds")
                     return 1
                 else:
                     self.move(0, neighboring_tiles)
@@ -0,0 +1,165 @@
+import os
+os.environ.setdefault("MPLBACKEND", "Agg")  # no display is needed, or used
+
+from main import Board
+from parameters import Parameters
+import numpy as np
+import argparse, itertools, json, platform, sys, time
+
+PHASES = ("activation", "ants", "tiles")
+
+# The default matrix, and a small one for a quick check
+MATRIX = {
+    "size": [15, 100, 500, 2000],
+    "ants": [6, 1000, 100000],
+    "food": [3, 100],
+    "engine": ["reference", "batched"],
+}
+QUICK_MATRIX = {
+    "size": [15, 100],
+    "ants": [6, 1000],
+    "food": [3],
+    "engine": ["reference", "batched"],
+}
+
+def case_name(case):
+    return f"{case['size']}x{case['size']} ants={case['ants']} food={case['food']} {case['engine']}"
+
+def cases(matrix):
+    """Every combination of the matrix, leaving out boards too small for their food."""
+    names = list(matrix)
+    for values in itertools.product(*(matrix[name] for name in names)):
+        case = dict(zip(names, values))
+        if case["food"] < case["size"] * case["size"] // 2:
+            yield case
+
+def run_case(case, steps = 100, warmup = 10, max_seconds = 30.0, seed = 0):
+    """
+    Times one case: builds its board, runs 'warmup' untimed timesteps, then up to 'steps'
+    timesteps (fewer if they take longer than max_seconds), the same way Board.simulate does,
+    timing the three phases of Board.update separately.
+
+    Every ant is activated on the first timestep (activated_per_timestep = ants), so that the
+    ants of big boards are all moving while they are timed.
+    """
+    size = case["size"]
+    params = Parameters(activated_per_timestep=case["ants"])
+    board = Board(width=size, height=size, spawn_radius=min(4, size // 4), num_ants=case["ants"], num_food=case["food"],
+                  engine=case["engine"], params=params, seed=seed)
+    board.simulate(warmup)
+
+    phases = [board.update_activation, board.update_ant_phase, board.update_tiles]
+    totals = [0.0] * len(phases)
+    ant_steps = 0
+    timed = 0
+    start = time.perf_counter()
+    while timed < steps and time.perf_counter() - start < max_seconds:
+        board.t += 1
+        for i, phase in enumerate(phases):
+            begin = time.perf_counter()
+            phase()
+            totals[i] += time.perf_counter() - begin
+        ant_steps += board.num_activated
+        timed += 1
+
+    seconds = sum(totals)
+    result = {
+        "case": case,
+        "name": case_name(case),
+        "steps": timed,
+        "seconds": seconds,
+        "steps_per_sec": timed / seconds,
+        "ns_per_ant_step": seconds / max(ant_steps, 1) * 1e9,
+        "ns_per_cell_step": seconds / (timed * size * size) * 1e9,
+        "phases": {},
+    }
+    for name, total in zip(PHASES, totals):
+        result["phases"][name] = {
+            "seconds": total,
+            "fraction": total / seconds,
+            "ns_per_ant_step": total / max(ant_steps, 1) * 1e9,
+            "ns_per_cell_step": total / (timed * size * size) * 1e9,
+        }
+    return result
+
+def run_benchmark(matrix = MATRIX, steps = 100, warmup = 10, max_seconds = 30.0, seed = 0, log = None):
+    """Runs every case of 'matrix' and returns the report (see run_case) as a JSON-able dict."""
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {"steps": steps, "warmup": warmup, "max_seconds": max_seconds, "seed": seed},
+        "results": [],
+    }
+    for case in cases(matrix):
+        result = run_case(case, steps, warmup, max_seconds, seed)
+        report["results"].append(result)
+        if log is not None:
+            log(format_result(result))
+    return report
+
+def format_result(result):
+    phases = "  ".join(f"{name} {result['phases'][name]['fraction']:.0%}" for name in PHASES)
+    return (f"{result['name']:<40} {result['steps_per_sec']:>10.1f} steps/s {result['ns_per_ant_step']:>12.0f} ns/ant-step "
+            f"{result['ns_per_cell_step']:>10.2f} ns/cell-step   {phases}")
+
+def compare(report, baseline, threshold = 0.1):
+    """
+    Compares the steps/sec of every case of 'report' with the same case in 'baseline'.
+    Returns (lines to print, names of the cases more than 'threshold' slower than the baseline).
+    """
+    previous = {result["name"]: result for result in baseline["results"]}
+    lines = []
+    regressions = []
+    for result in report["results"]:
+        old = previous.get(result["name"])
+        if old is None:
+            lines.append(f"{result['name']:<40} (not in the baseline)")
+            continue
+        ratio = result["steps_per_sec"] / old["steps_per_sec"]
+        flag = ""
+        if ratio < 1 - threshold:
+            flag = "  REGRESSION"
+            regressions.append(result["name"])
+        lines.append(f"{result['name']:<40} {old['steps_per_sec']:>10.1f} -> {result['steps_per_sec']:>10.1f} steps/s  x{ratio:.2f}{flag}")
+    return lines, regressions
+
+if __name__ == "__main__":
+    """
+    Benchmarks Board.update over a matrix of board sizes, ant counts, food counts and engines,
+    writes the results as JSON and compares them with a baseline.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output", help="JSON file to write the results to", default = None)
+    parser.add_argument("-b", "--baseline", help="JSON file of an earlier run to compare with", default = None)
+    parser.add_argument("--threshold", type=float, help="slowdown (as a fraction of steps/sec) counted as a regression", default = 0.1)
+    parser.add_argument("--quick", help="only run a small matrix", action="store_true")
+    parser.add_argument("--sizes", type=int, nargs="+", help="board sizes (width = height) to run", default = None)
+    parser.add_argument("--ants", type=int, nargs="+", help="ant counts to run", default = None)
+    parser.add_argument("--food", type=int, nargs="+", help="food counts to run", default = None)
+    parser.add_argument("--engines", nargs="+", choices=["reference", "batched"], help="engines to run", default = None)
+    parser.add_argument("-t", "--steps", type=int, help="timesteps timed per case", default = 100)
+    parser.add_argument("--warmup", type=int, help="untimed timesteps before timing each case", default = 10)
+    parser.add_argument("--max-seconds", type=float, help="stop timing a case after this long", default = 30.0)
+    parser.add_argument("-s", "--seed", type=int, help="seed of the boards", default = 0)
+    args = parser.parse_args()
+
+    matrix = dict(QUICK_MATRIX if args.quick else MATRIX)
+    for name, values in (("size", args.sizes), ("ants", args.ants), ("food", args.food), ("engine", args.engines)):
+        if values:
+            matrix[name] = values
+
+    report = run_benchmark(matrix, args.steps, args.warmup, args.max_seconds, args.seed, log = print)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        lines, regressions = compare(report, baseline, args.threshold)
+        print("\n".join(lines))
+        if regressions:
+            print(f"{len(regressions)} case(s) slower than the baseline by more than {args.threshold:.0%}")
+            sys.exit(1)
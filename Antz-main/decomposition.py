@@ -0,0 +1,468 @@
+from tile import multiplicative_decay, exponential_decay
+import numpy as np
+import multiprocessing
+from multiprocessing import shared_memory
+
+class SharedArrays:
+    """
+    numpy arrays living in named shared memory blocks. 'spec' maps each array's name to its
+    (shape, dtype); the process which creates them passes spec and names() to the workers,
+    which attach to the same memory with SharedArrays(spec, names).
+    """
+    def __init__(self, spec, names = None):
+        self.spec = spec
+        self.blocks = {}
+        self.arrays = {}
+        for key, (shape, dtype) in spec.items():
+            size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            if names is None:
+                block = shared_memory.SharedMemory(create=True, size=size)
+            else:
+                block = shared_memory.SharedMemory(name=names[key])
+            self.blocks[key] = block
+            self.arrays[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+    def __getitem__(self, key):
+        return self.arrays[key]
+
+    def names(self):
+        return {key: block.name for key, block in self.blocks.items()}
+
+    def close(self):
+        self.arrays = {}
+        for block in self.blocks.values():
+            block.close()
+
+    def unlink(self):
+        for block in self.blocks.values():
+            block.unlink()
+
+def strip_bounds(height, workers):
+    """Splits the rows of a board into 'workers' contiguous strips, as (first row, end row) pairs."""
+    edges = np.linspace(0, height, workers + 1).round().astype(int)
+    return [(int(edges[k]), int(edges[k + 1])) for k in range(workers)]
+
+class Strip:
+    """
+    The part of a decomposed board stepped by one worker process: rows [low, high) of every
+    tile array, and the ants standing on them ('owned', ascending ant indices).
+
+    Every timestep goes through three phases separated by barriers across all the workers:
+    1. decide: every ant picks up or drops food, or picks the tile it wants to move to, from
+       the state at the start of the timestep. The rows just above and below the strip are
+       read in place in shared memory (they are the halo). Claims on tiles of a neighboring
+       strip are posted to that neighbor.
+    2. resolve: the owner of each claimed tile resolves the claims on it, its own ants' and
+       the posted ones together: the lowest ant index wins, except on the colony, which every
+       ant may enter. The answers to posted claims are written back next to them.
+    3. apply: the winning ants leave pheromone on their old tile and move, then the strip's
+       rows decay. Ants which moved onto a neighbor's rows are handed off to it, and are
+       added to its ants at the start of the next timestep.
+    These are the parallel rules of BatchedEngine, so a decomposed run is identical to one
+    stepped by BatchedEngine(board) under the same seed.
+    """
+    def __init__(self, shared, k, bounds, setup):
+        self.shared = shared
+        self.k = k
+        self.low, self.high = bounds[k]
+        self.bounds = bounds
+        self.setup = setup
+        self.width = setup["width"]
+        self.events = []
+        y = shared["y"]
+        self.owned = np.flatnonzero((y >= self.low) & (y < self.high))
+        self.colony_owner = self.low <= setup["colony"][0] < self.high
+        self.num_activated = setup["num_activated"]
+        # neighbors the strip exchanges claims and ants with: 0 is the one above, 1 the one below
+        self.neighbors = [k - 1 if k > 0 else None, k + 1 if k + 1 < len(bounds) else None]
+        self.scratch = None
+
+    def owner(self, rows):
+        """0 for rows above the strip, 1 for rows below it, -1 for its own rows."""
+        return np.where(rows < self.low, 0, np.where(rows >= self.high, 1, -1))
+
+    def activate(self):
+        """Board.activate_ants: the next ants leave the colony, which is on one strip only."""
+        new_total = min(self.num_activated + self.setup["activated_per_timestep"], self.setup["num_ants"])
+        if self.colony_owner:
+            self.shared["activated"][self.num_activated:new_total] = True
+        self.num_activated = new_total
+
+    def decide(self, t, draws):
+        """Phase 1 (see the class docstring). Only the strip's own ants are written to."""
+        s = self.shared
+        ants = self.owned[s["activated"][self.owned]]
+        y = s["y"][ants]
+        x = s["x"][ants]
+        has_food = s["has_food"][ants]
+        draws = draws[ants]
+
+        # picking up food, or dropping it at the colony, and turning around
+        picked = ~has_food & s["has_food_tile"][y, x]
+        dropped = has_food & s["is_colony"][y, x]
+        s["has_food"][ants[picked]] = True
+        s["has_food"][ants[dropped]] = False
+        turned = ants[picked | dropped]
+        s["direction"][turned] = (s["direction"][turned] + 4) % 8
+        for kind, mask in ((0, picked), (1, dropped)):
+            if mask.any():
+                self.events.append(np.stack([np.full(mask.sum(), t), np.full(mask.sum(), kind), ants[mask], y[mask], x[mask]], axis=1))
+
+        walking = ~(picked | dropped)
+        ants = ants[walking]
+        y = y[walking]
+        x = x[walking]
+        draws = draws[walking]
+        has_food = has_food[walking]
+        direction = s["direction"][ants]
+
+        # the three tiles in front of each ant (left, forward, right), as in BatchedEngine.move
+        facing = (direction[:, None] + np.array([-1, 0, 1])) % 8
+        neighbors = s["neighbors"][(y * self.width + x)[:, None], facing]
+        valid = neighbors >= 0
+        neighbors = np.where(valid, neighbors, 0)
+        valid &= ~s["is_occupied"].ravel()[neighbors]
+        ty, tx = np.divmod(neighbors.astype(np.int64), self.width)
+
+        carrying = has_food[:, None]
+        objective = valid & np.where(carrying, s["is_colony"][ty, tx], s["has_food_tile"][ty, tx])
+        pheromone = np.where(carrying, s["food_pheromone"][ty, tx], s["home_pheromone"][ty, tx])
+        pheromone = np.where(valid, pheromone, 0)
+
+        exploit = draws[:, 0] <= self.setup["exploit_probability"]
+        eligible = np.where(exploit[:, None], pheromone == pheromone.max(axis=1)[:, None], pheromone > 0)
+        count = eligible.sum(axis=1)
+        pick = np.floor(draws[:, 1] * count).astype(np.int64)
+        choice = np.argmax(np.cumsum(eligible, axis=1) > pick[:, None], axis=1)
+        priority = objective[:, [1, 0, 2]]
+        seeking = priority.any(axis=1)
+        choice = np.where(seeking, np.array([1, 0, 2])[np.argmax(priority, axis=1)], choice)
+
+        blocked = ~valid.any(axis=1)
+        side = np.where(draws[:, 1] < 0.5, -1, 1)
+        s["direction"][ants[blocked]] = (direction[blocked] + side[blocked]) % 8
+
+        rows = np.flatnonzero(~blocked)
+        choice = choice[rows]
+        self.movers = ants[rows]
+        self.old_y = y[rows]
+        self.old_x = x[rows]
+        self.new_y = ty[rows, choice]
+        self.new_x = tx[rows, choice]
+        self.new_direction = facing[rows, choice]
+        self.carrying = has_food[rows]
+
+        # claims on a neighbor's tiles are posted to it
+        owner = self.owner(self.new_y)
+        self.local = owner == -1
+        for side in (0, 1):
+            mine = owner == side
+            n = int(mine.sum())
+            s[f"claim_count_{self.k}"][side] = n
+            s[f"claim_ids_{self.k}"][side, :n] = self.movers[mine]
+            s[f"claim_cells_{self.k}"][side, :n] = self.new_y[mine] * self.width + self.new_x[mine]
+
+    def resolve(self):
+        """Phase 2: decides every claim on the strip's tiles, answering the posted ones."""
+        s = self.shared
+        ids = [self.movers[self.local]]
+        cells = [self.new_y[self.local] * self.width + self.new_x[self.local]]
+        # a neighbor above posts on its side 1 (below it), a neighbor below on its side 0
+        posted = []
+        for side, neighbor in enumerate(self.neighbors):
+            if neighbor is None:
+                continue
+            their_side = 1 - side
+            n = int(s[f"claim_count_{neighbor}"][their_side])
+            ids.append(s[f"claim_ids_{neighbor}"][their_side, :n])
+            cells.append(s[f"claim_cells_{neighbor}"][their_side, :n])
+            posted.append((neighbor, their_side, n))
+        ids = np.concatenate(ids)
+        cells = np.concatenate(cells)
+
+        # the lowest ant index wins each tile, every claim on the colony wins
+        order = np.lexsort((ids, cells))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = cells[order][1:] != cells[order][:-1]
+        won = np.zeros(len(order), dtype=bool)
+        won[order] = first
+        won |= s["is_colony"].ravel()[cells]
+
+        local = int(self.local.sum())
+        self.local_won = won[:local]
+        start = local
+        for neighbor, their_side, n in posted:
+            s[f"claim_won_{neighbor}"][their_side, :n] = won[start:start + n]
+            start += n
+
+    def apply(self):
+        """Phase 3: moves the winners, decays the strip and hands off the ants which left it."""
+        s = self.shared
+        winner = np.zeros(len(self.movers), dtype=bool)
+        winner[self.local] = self.local_won
+        owner = self.owner(self.new_y)
+        for side in (0, 1):
+            mine = owner == side
+            if mine.any():
+                winner[mine] = s[f"claim_won_{self.k}"][side, :int(mine.sum())]
+
+        ants = self.movers[winner]
+        old_y = self.old_y[winner]
+        old_x = self.old_x[winner]
+        new_y = self.new_y[winner]
+        new_x = self.new_x[winner]
+        carrying = self.carrying[winner]
+
+        # march: leave pheromone on the old tile (unless colony or food), then move
+        marking = ~s["is_colony"][old_y, old_x] & ~s["has_food_tile"][old_y, old_x]
+        with_food = carrying & marking
+        without_food = ~carrying & marking
+        deposit = self.setup["deposit"]
+        s["home_pheromone"][old_y[with_food], old_x[with_food]] += deposit
+        s["food_pheromone"][old_y[without_food], old_x[without_food]] += deposit
+        s["is_occupied"][old_y, old_x] = False
+        entering = ~s["is_colony"][new_y, new_x]
+        s["is_occupied"][new_y[entering], new_x[entering]] = True
+        s["y"][ants] = new_y
+        s["x"][ants] = new_x
+        s["direction"][ants] = self.new_direction[winner]
+
+        self.decay()
+
+        # ants which left the strip are handed off to the neighbor owning their new row
+        owner = self.owner(new_y)
+        leaving = owner != -1
+        for side in (0, 1):
+            mine = ants[owner == side]
+            s[f"hand_count_{self.k}"][side] = len(mine)
+            s[f"hand_ids_{self.k}"][side, :len(mine)] = mine
+        if leaving.any():
+            self.owned = np.setdiff1d(self.owned, ants[leaving], assume_unique=True)
+
+    def decay(self):
+        """TileField.decay on the strip's rows only."""
+        setup = self.setup
+        for name, (a, b, c) in (("food_pheromone", setup["food_constants"]), ("home_pheromone", setup["home_constants"])):
+            rows = self.shared[name][self.low:self.high]
+            if setup["decay_model"] == "exponential":
+                if self.scratch is None:
+                    self.scratch = np.empty_like(rows)
+                exponential_decay(rows, a, b, c, setup["inital_pheromone"], self.scratch)
+            else:
+                multiplicative_decay(rows, setup["decay_rate"], setup["pheromone_floor"])
+
+    def receive(self):
+        """Adds the ants handed off by the neighbors during the last timestep."""
+        s = self.shared
+        incoming = []
+        for side, neighbor in enumerate(self.neighbors):
+            if neighbor is None:
+                continue
+            their_side = 1 - side
+            n = int(s[f"hand_count_{neighbor}"][their_side])
+            if n:
+                incoming.append(s[f"hand_ids_{neighbor}"][their_side, :n])
+        if incoming:
+            self.owned = np.union1d(self.owned, np.concatenate(incoming))
+
+def run_strip(names, spec, k, bounds, setup, step_barrier, block_barrier, results):
+    """
+    Worker process: steps strip k for setup["time"] timesteps, then puts (k, events) on
+    'results', events holding one (t, kind, ant, y, x) row per food collected or deposited.
+    """
+    shared = SharedArrays(spec, names)
+    try:
+        strip = Strip(shared, k, bounds, setup)
+        slot = 0
+        row = 0
+        for step in range(setup["time"]):
+            if row == shared["block_lengths"][slot]:
+                block_barrier.wait()  # the next block of draws is ready
+                slot = 1 - slot
+                row = 0
+            t = setup["t"] + step + 1
+            strip.activate()
+            strip.decide(t, shared["draws"][slot, row])
+            row += 1
+            step_barrier.wait()
+            strip.resolve()
+            step_barrier.wait()
+            strip.apply()
+            step_barrier.wait()
+            strip.receive()
+        events = np.concatenate(strip.events) if strip.events else np.empty((0, 5), dtype=np.int64)
+        results.put((k, events))
+    except BaseException:
+        step_barrier.abort()
+        block_barrier.abort()
+        raise
+    finally:
+        strip = None
+        shared.close()
+
+class StripDecomposition:
+    """
+    Runs a board across several worker processes, each owning a horizontal strip of its rows
+    (see Strip), with the tile and ant arrays in shared memory.
+
+    The ants follow the parallel rules of BatchedEngine whichever engine the board was made
+    with, and the random numbers come from the board's own RandomStream, drawn by this process
+    a block ahead of the workers. A decomposed run is therefore the same as
+    Board(engine="batched", seed=...) would give. The board is brought up to date after each
+    simulate call (tiles, ants, t, recorder, random state), so it can be inspected, plotted,
+    or simulated further either way.
+
+    The food must be infinite (the default) and there must be a single colony: the workers do
+    not share the board's FoodRegistry, and keep one pheromone layer of each kind. There must
+    be no diffusion either, which would need the rows around each strip every timestep.
+    Obstacles are followed, through the board's neighbor table.
+
+    Worker processes are started by each simulate call, so it is meant for long runs on large
+    boards: every timestep costs three barriers across the workers.
+    """
+    def __init__(self, board, workers = None):
+        self.board = board
+        self.workers = min(workers or multiprocessing.cpu_count(), board.height)
+        self.bounds = strip_bounds(board.height, self.workers)
+
+    def simulate(self, time = 100):
+        board = self.board
+        if time <= 0:
+            return
+        if board.food.finite:
+            raise ValueError("A StripDecomposition only runs boards whose food never runs out.")
+        if board.grid.colonies > 1:
+            raise ValueError("A StripDecomposition only runs boards with a single colony.")
+        if board.grid.diffusion is not None:
+            raise ValueError("A StripDecomposition only runs boards without diffusion.")
+        field = board.grid
+        state = board.ant_state
+        stream = board.stream
+        num_ants = board.num_ants
+        height, width = board.height, board.width
+        if field.lazy_decay:
+            field.synchronize()
+
+        # the draws of the timesteps: what is left of the stream's block, then new blocks
+        blocks = []
+        left = stream.block[stream.position:]
+        if len(left):
+            blocks.append(left[:time])
+        needed = time - sum(len(block) for block in blocks)
+        while needed > 0:
+            blocks.append(None)  # drawn when the workers get close to it
+            needed -= min(stream.block_steps, needed)
+        block_rows = max(len(stream.block), stream.block_steps)
+        self.block_states = {}
+
+        colony_row = board.colony[0]
+        spec = {
+            "home_pheromone": ((height, width), field.home_pheromone.dtype),
+            "food_pheromone": ((height, width), field.food_pheromone.dtype),
+            "has_food_tile": ((height, width), bool),
+            "is_colony": ((height, width), bool),
+            "is_occupied": ((height, width), bool),
+            "neighbors": (board.neighbor_table.shape, np.int32),
+            "y": ((num_ants,), np.int64),
+            "x": ((num_ants,), np.int64),
+            "direction": ((num_ants,), np.int64),
+            "has_food": ((num_ants,), bool),
+            "activated": ((num_ants,), bool),
+            "draws": ((2, block_rows, num_ants, 2), np.float64),
+            "block_lengths": ((2,), np.int64),
+        }
+        for k, (low, high) in enumerate(self.bounds):
+            # only the rows next to a strip's edges send ants across, at most one per tile
+            # except on the colony, where any number of ants may stand
+            capacity = width + (num_ants if abs(colony_row - low) <= 1 or abs(colony_row - (high - 1)) <= 1 else 0)
+            spec[f"claim_count_{k}"] = ((2,), np.int64)
+            spec[f"claim_ids_{k}"] = ((2, capacity), np.int64)
+            spec[f"claim_cells_{k}"] = ((2, capacity), np.int64)
+            spec[f"claim_won_{k}"] = ((2, capacity), bool)
+            spec[f"hand_count_{k}"] = ((2,), np.int64)
+            spec[f"hand_ids_{k}"] = ((2, capacity), np.int64)
+
+        shared = SharedArrays(spec)
+        try:
+            for key, array in (("home_pheromone", field.home_pheromone), ("food_pheromone", field.food_pheromone),
+                               ("has_food_tile", field.has_food), ("is_colony", field.is_colony), ("is_occupied", field.is_occupied),
+                               ("neighbors", board.neighbor_table), ("y", state.y), ("x", state.x), ("direction", state.direction),
+                               ("has_food", state.has_food), ("activated", state.activated)):
+                shared[key][...] = array
+            self.fill_block(shared, blocks, 0, stream)
+
+            setup = {
+                "width": width, "num_ants": num_ants, "time": time, "t": board.t, "colony": board.colony,
+                "num_activated": board.num_activated, "activated_per_timestep": board.activated_per_timestep,
+                "exploit_probability": board.params.exploit_probability, "deposit": board.params.deposit,
+                "decay_model": field.decay_model, "decay_rate": field.decay_rate, "pheromone_floor": field.pheromone_floor,
+                "inital_pheromone": field.inital_pheromone,
+                "food_constants": (field.a_f, field.b_f, field.c_f), "home_constants": (field.a_h, field.b_h, field.c_h),
+            }
+            step_barrier = multiprocessing.Barrier(self.workers)
+            block_barrier = multiprocessing.Barrier(self.workers + 1)
+            results = multiprocessing.Queue()
+            processes = [multiprocessing.Process(target=run_strip, args=(shared.names(), spec, k, self.bounds, setup, step_barrier, block_barrier, results))
+                         for k in range(self.workers)]
+            for process in processes:
+                process.start()
+            try:
+                for b in range(1, len(blocks)):
+                    self.fill_block(shared, blocks, b, stream)
+                    block_barrier.wait()
+                events = [results.get() for process in processes]
+            except BaseException:
+                step_barrier.abort()
+                block_barrier.abort()
+                for process in processes:
+                    process.terminate()
+                raise
+            finally:
+                for process in processes:
+                    process.join()
+            failed = [k for k, process in enumerate(processes) if process.exitcode != 0]
+            if failed:
+                raise RuntimeError(f"Strip worker(s) {failed} failed.")
+
+            for key, array in (("home_pheromone", field.home_pheromone), ("food_pheromone", field.food_pheromone),
+                               ("is_occupied", field.is_occupied), ("y", state.y), ("x", state.x),
+                               ("direction", state.direction), ("has_food", state.has_food), ("activated", state.activated)):
+                array[...] = shared[key]
+        finally:
+            shared.close()
+            shared.unlink()
+
+        # the random stream carries on from the last block used
+        if len(blocks) == 1 and len(left):
+            stream.position += time
+        else:
+            stream.block = blocks[-1]
+            stream.block_state = self.block_states[len(blocks) - 1]
+            stream.position = time - sum(len(block) for block in blocks[:-1])
+
+        self.record(np.concatenate([e for k, e in sorted(events, key=lambda item: item[0])]), time)
+        board.t += time
+        board.num_activated = min(board.num_activated + time * board.activated_per_timestep, num_ants)
+        field.clock += time
+        if field.lazy_decay:
+            field.last_update[...] = field.clock
+            field.on_initial_curve[...] = False
+
+    def fill_block(self, shared, blocks, b, stream):
+        """Puts block b of the draws in slot b % 2 of the shared buffer, drawing it if it is new."""
+        if blocks[b] is None:
+            self.block_states[b] = stream.rng.bit_generator.state
+            blocks[b] = stream.rng.random((stream.block_steps, stream.num_ants, 2))
+        shared["draws"][b % 2, :len(blocks[b])] = blocks[b]
+        shared["block_lengths"][b % 2] = len(blocks[b])
+
+    def record(self, events, time):
+        """Gives the board's recorder the food events of the run, timestep by timestep, in ant order."""
+        board = self.board
+        events = events[np.lexsort((events[:, 2], events[:, 1], events[:, 0]))]
+        starts = np.searchsorted(events[:, 0], np.arange(board.t + 1, board.t + time + 2))
+        for i in range(time):
+            step = events[starts[i]:starts[i + 1]]
+            collected = step[step[:, 1] == 0]
+            deposited = step[step[:, 1] == 1]
+            board.recorder.record(board.t + i + 1, (collected[:, 3], collected[:, 4]), (deposited[:, 3], deposited[:, 4]))
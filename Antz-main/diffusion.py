@@ -0,0 +1,164 @@
+import numpy as np
+
+DIFFUSION_METHODS = ("auto", "stencil", "fft")
+
+def fast_length(n):
+    """The smallest length >= n with no prime factor above 5, which the FFT handles quickly."""
+    while True:
+        m = n
+        for p in (2, 3, 5):
+            while m % p == 0:
+                m //= p
+        if m == 1:
+            return n
+        n += 1
+
+class Diffusion:
+    """
+    One timestep of pheromone diffusion, applied to a whole (layers, height, width) stack at once.
+
+    Every open tile moves 'rate' of the way towards the mean of the open tiles within 'radius'
+    of it (the (2 * radius + 1)**2 square around it, the tile itself left out). Tiles off the
+    board and blocked tiles are not counted, and blocked tiles keep their level. A flat field
+    stays flat, but the total is not conserved exactly, as each tile weighs its neighbors by
+    its own count of open tiles, which is smaller at the edges and next to walls.
+
+    method "stencil" sums the square as a row pass then a column pass of shifted slices, in
+    bands of rows small enough to stay in the CPU cache (see stencil). "fft" convolves with
+    the square in the frequency domain, a cost which does not grow with the radius. "auto"
+    (the default) takes the FFT once the radius makes the slices the slower of the two.
+
+    The scratch arrays and the neighbor counts are kept between calls and rebuilt when the
+    shape of the stack or the blocked mask (a new array from TileField.set_blocked) changes.
+    """
+    # radius from which "auto" takes the FFT (measured on boards of 200x200 to 2000x2000 tiles)
+    FFT_RADIUS = 12
+    # bytes of pheromone in each band of rows the stencil works on
+    BAND_BYTES = 1 << 18
+
+    def __init__(self, rate, radius = 1, method = "auto"):
+        if not 0 <= rate <= 1:
+            raise ValueError(f"The diffusion rate must be between 0 and 1, not {rate}.")
+        if radius < 1:
+            raise ValueError(f"The diffusion radius must be at least 1, not {radius}.")
+        if method not in DIFFUSION_METHODS:
+            raise ValueError(f"Unknown diffusion method {method!r}, expected one of {DIFFUSION_METHODS}.")
+        self.rate = rate
+        self.radius = int(radius)
+        self.method = method
+        self._cache = None
+
+    @property
+    def uses_fft(self):
+        return self.method == "fft" or (self.method == "auto" and self.radius >= self.FFT_RADIUS)
+
+    def __getstate__(self):
+        # the scratch arrays are rebuilt on demand
+        state = self.__dict__.copy()
+        state["_cache"] = None
+        return state
+
+    def __call__(self, pheromone, blocked = None):
+        """Diffuses 'pheromone' (layers, height, width) in place. 'blocked' is the (height, width) mask of blocked tiles, or None."""
+        cache = self.prepare(pheromone, blocked)
+        if self.uses_fft:
+            total = cache["total"]
+            self.fft_sum(pheromone, cache)
+            self.combine(pheromone, total, cache["keep"], cache["share"])
+        else:
+            self.stencil(pheromone, cache)
+
+    def combine(self, pheromone, total, keep, share):
+        # pheromone * keep + total * share: the tile's own level counts in total, so keep takes it back out
+        np.multiply(pheromone, keep, out=pheromone)
+        np.multiply(total, share, out=total)
+        np.add(pheromone, total, out=pheromone)
+
+    def stencil(self, pheromone, cache):
+        """
+        The box sums by shifted slices, a band of rows at a time so that the work arrays stay in
+        the CPU cache. Each band is copied into 'window' with the radius rows above it (as they
+        were before the band above was written) and below it, inside a border of zeros. Summing
+        along rows then works on the flattened window, which numpy adds in one run rather than
+        row by row: only the border columns mix up neighboring rows, and they are not used.
+        """
+        r = self.radius
+        height, width = pheromone.shape[1:]
+        band = cache["band"]
+        window, rows, total = cache["window"], cache["rows"], cache["total"]
+        open_tiles, keep, share = cache["open"], cache["keep"], cache["share"]
+        flat_window = window.reshape(-1)
+        flat_rows = rows.reshape(-1)[r:-r]
+        size = len(flat_rows)
+        window[:, :r] = 0
+        for y0 in range(0, height, band):
+            y1 = min(y0 + band, height)
+            n = y1 - y0
+            below = min(y1 + r, height)
+            inside = window[:, r:r + below - y0, r:r + width]
+            if open_tiles is None:
+                np.copyto(inside, pheromone[:, y0:below])
+            else:
+                np.multiply(pheromone[:, y0:below], open_tiles[y0:below], out=inside)
+            if below - y0 < band + r:
+                window[:, r + below - y0:] = 0
+            np.add(flat_window[:size], flat_window[1:size + 1], out=flat_rows)
+            for d in range(2, 2 * r + 1):
+                np.add(flat_rows, flat_window[d:size + d], out=flat_rows)
+            np.add(rows[:, :n, r:r + width], rows[:, 1:n + 1, r:r + width], out=total[:, :n])
+            for d in range(2, 2 * r + 1):
+                np.add(total[:, :n], rows[:, d:n + d, r:r + width], out=total[:, :n])
+            # the rows above the next band, before this band is written
+            np.copyto(window[:, :r], window[:, n:n + r])
+            self.combine(pheromone[:, y0:y1], total[:, :n], keep[y0:y1], share[y0:y1])
+
+    def fft_sum(self, pheromone, cache):
+        """The box sums of the open tiles' pheromone, into cache["total"], by a linear convolution through the FFT."""
+        r = self.radius
+        height, width = pheromone.shape[1:]
+        masked = pheromone if cache["open"] is None else pheromone * cache["open"]
+        spectrum = np.fft.rfft2(masked, s=cache["fft_shape"])
+        spectrum *= cache["kernel"]
+        summed = np.fft.irfft2(spectrum, s=cache["fft_shape"])
+        np.copyto(cache["total"], summed[:, r:r + height, r:r + width])
+
+    def prepare(self, pheromone, blocked):
+        """The scratch arrays and per-tile weights for this stack and mask, built on the first call and when either changes."""
+        key = (pheromone.shape, pheromone.dtype, id(blocked), self.uses_fft)
+        if self._cache is not None and self._cache["key"] == key and self._cache["blocked"] is blocked:
+            return self._cache
+        layers, height, width = pheromone.shape
+        r = self.radius
+        dtype = pheromone.dtype
+        open_tiles = None if blocked is None or not blocked.any() else (~blocked).astype(dtype)
+
+        # the number of open tiles around each tile
+        mask = np.ones((height, width), dtype=dtype) if open_tiles is None else open_tiles
+        padded = np.pad(mask, r)
+        counts = -mask
+        for dy in range(2 * r + 1):
+            for dx in range(2 * r + 1):
+                counts = counts + padded[dy:dy + height, dx:dx + width]
+        moving = (mask > 0) & (counts > 0)
+        share = np.zeros((height, width), dtype=dtype)
+        share[moving] = self.rate / counts[moving]
+        keep = 1 - self.rate * moving
+        # the tile itself is part of the box sum, so its share of that is taken off what it keeps
+        keep = (keep - share * mask).astype(dtype)
+
+        cache = {"key": key, "blocked": blocked, "open": open_tiles, "keep": keep, "share": share}
+        if self.uses_fft:
+            fft_shape = (fast_length(height + 2 * r), fast_length(width + 2 * r))
+            kernel = np.zeros(fft_shape, dtype=dtype)
+            kernel[:2 * r + 1, :2 * r + 1] = 1
+            cache["fft_shape"] = fft_shape
+            cache["kernel"] = np.fft.rfft2(kernel)
+            cache["total"] = np.empty((layers, height, width), dtype=dtype)
+        else:
+            band = min(height, max(self.BAND_BYTES // (layers * width * dtype.itemsize), r, 1))
+            cache["band"] = band
+            cache["window"] = np.zeros((layers, band + 2 * r, width + 2 * r), dtype=dtype)
+            cache["rows"] = np.empty((layers, band + 2 * r, width + 2 * r), dtype=dtype)
+            cache["total"] = np.empty((layers, band, width), dtype=dtype)
+        self._cache = cache
+        return cache
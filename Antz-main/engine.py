@@ -0,0 +1,179 @@
+import numpy as np
+
+class BatchedEngine:
+    """
+    Steps every activated ant of a board at once with array operations, replacing the per-ant
+    loop over Ant.update in Board.update. The ants' state is read from and written to the
+    board's AntArrays, so the Ant objects keep reflecting it.
+
+    Each step follows the rules of Ant.update: an ant without food standing on food picks it up
+    and turns around, an ant with food standing on the colony drops it and turns around, and
+    every other ant looks at its three forward tiles (left, forward, right). It moves into the
+    first of them (forward, left, right) holding its objective, otherwise it applies the
+    decide_turning rule to their pheromone levels, and turns left or right at random if all
+    three are blocked.
+
+    Every ant uses its two uniforms of the step from the board's RandomStream, exactly as
+    Ant.update does: the first picks exploit (<= exploit_probability) or explore, the second
+    picks among the eligible tiles (or the side to turn to when blocked). The sequential mode
+    therefore reproduces the reference engine bit for bit under the same seed.
+
+    In the default (parallel) mode all ants decide on the state at the start of the step:
+    - a tile vacated during the step cannot be entered until the next step
+    - pheromone left during the step is not seen until the next step
+    - when several ants claim the same free tile, the ant with the lowest index (the one
+      activated first) gets it. The others stay where they are, facing the same way.
+    Ants may always share the colony tile, as in the sequential rules.
+
+    With several colonies, each ant only drops food at, heads for, and follows and leaves the
+    pheromone of, its own colony (AntArrays.colony).
+
+    With sequential=True the ants are stepped one after another in index order, each one seeing
+    the moves and pheromone of the ants before it. This reproduces the in-order semantics of
+    the Ant.update loop and is meant for validating the parallel mode.
+    """
+    def __init__(self, board, sequential = False):
+        self.board = board
+        self.sequential = sequential
+
+    def step(self):
+        """
+        Steps every activated ant once. Returns the indices of the ants which picked up food
+        and the indices of the ants which dropped food at the colony, in index order.
+        """
+        state = self.board.ant_state
+        active = np.flatnonzero(state.activated)
+        draws = state.draws[active]
+        if not self.sequential:
+            return self.advance(active, draws)
+        collected = []
+        deposited = []
+        for i in range(len(active)):
+            picked, dropped = self.advance(active[i:i + 1], draws[i:i + 1])
+            collected.extend(picked)
+            deposited.extend(dropped)
+        return np.array(collected, dtype=np.int64), np.array(deposited, dtype=np.int64)
+
+    def advance(self, ants, draws):
+        """
+        Applies one step to the ants with (ascending) indices 'ants', using one row of 'draws'
+        per ant. Returns the indices of the ants which picked up and dropped food.
+        """
+        state = self.board.ant_state
+        field = self.board.grid
+        y = state.y[ants]
+        x = state.x[ants]
+        has_food = state.has_food[ants]
+
+        # picking up food, or dropping it at the colony, and turning around
+        picked = ~has_food & field.has_food[y, x]
+        dropped = has_food & (field.colony_map[y, x] == state.colony[ants])
+        state.has_food[ants[picked]] = True
+        state.has_food[ants[dropped]] = False
+        turned = ants[picked | dropped]
+        state.direction[turned] = (state.direction[turned] + 4) % 8
+        if state.profiler is not None:
+            state.profiler.count("turn_arounds", len(turned))
+
+        # every other ant moves
+        walking = ~(picked | dropped)
+        if walking.any():
+            self.move(ants[walking], draws[walking])
+        return ants[picked], ants[dropped]
+
+    def move(self, ants, draws):
+        """The vectorized Ant.move for ants which are neither picking up nor dropping food."""
+        board = self.board
+        state = board.ant_state
+        field = board.grid
+        y = state.y[ants]
+        x = state.x[ants]
+        direction = state.direction[ants]
+        has_food = state.has_food[ants]
+        colony = state.colony[ants]
+
+        # the three tiles in front of each ant (left, forward, right), from the neighbor table
+        facing = (direction[:, None] + np.array([-1, 0, 1])) % 8
+        neighbors = board.neighbor_table[(y * board.width + x)[:, None], facing]  # -1 is off the board
+        valid = neighbors >= 0
+        neighbors = np.where(valid, neighbors, 0)
+        valid &= ~field.is_occupied.ravel()[neighbors]
+        ty, tx = np.divmod(neighbors.astype(np.int64), board.width)
+
+        # an ant with food looks for the colony and follows food pheromone (code 0),
+        # an ant without food looks for food and follows home pheromone (code 1)
+        carrying = has_food[:, None]
+        objective = valid & np.where(carrying, field.colony_map[ty, tx] == colony[:, None], field.has_food[ty, tx])
+        field.synchronize((ty[valid], tx[valid]))
+        if field.colonies == 1:
+            pheromone = np.where(carrying, field.food_pheromone[ty, tx], field.home_pheromone[ty, tx])
+        else:
+            pheromone = np.where(carrying, field.food_layers[colony[:, None], ty, tx], field.home_layers[colony[:, None], ty, tx])
+        pheromone = np.where(valid, pheromone, 0)
+
+        # decide_turning: exploit (any of the maximal tiles) with probability exploit_probability,
+        # else explore (any tile with pheromone), both picking uniformly with the second draw.
+        # Blocked and off-board slots read 0, so they are masked out rather than tying with open tiles at 0
+        exploit = draws[:, 0] <= board.params.exploit_probability
+        eligible = np.where(exploit[:, None], pheromone == pheromone.max(axis=1)[:, None], pheromone > 0) & valid
+        count = eligible.sum(axis=1)
+        pick = np.floor(draws[:, 1] * count).astype(np.int64)
+        choice = np.argmax(np.cumsum(eligible, axis=1) > pick[:, None], axis=1)
+
+        # a tile holding the objective wins, checked in the order forward, left, right
+        priority = objective[:, [1, 0, 2]]
+        seeking = priority.any(axis=1)
+        choice = np.where(seeking, np.array([1, 0, 2])[np.argmax(priority, axis=1)], choice)
+
+        # all three tiles blocked, or none of them eligible (nothing to explore): turn left or
+        # right at random and stay
+        blocked = ~valid.any(axis=1) | (~seeking & (count == 0))
+        side = np.where(draws[:, 1] < 0.5, -1, 1)
+        state.direction[ants[blocked]] = (direction[blocked] + side[blocked]) % 8
+
+        if state.profiler is not None:
+            deciding = ~blocked & ~seeking
+            state.profiler.count("moves", len(ants))
+            state.profiler.count("neighbor_lookups", len(ants))
+            state.profiler.count("blocked_moves", int(blocked.sum()))
+            state.profiler.count("exploit", int((exploit & deciding).sum()))
+            state.profiler.count("explore", int((~exploit & deciding).sum()))
+
+        moving = np.flatnonzero(~blocked)
+        rows = np.arange(len(ants))[moving]
+        choice = choice[moving]
+        new_y = ty[rows, choice]
+        new_x = tx[rows, choice]
+        new_direction = facing[rows, choice]
+
+        # conflicting claims on the same tile: the lowest ant index wins (ants are ascending)
+        target = new_y * board.width + new_x
+        shared = field.is_colony[new_y, new_x]
+        _, first = np.unique(target, return_index=True)
+        winner = np.zeros(len(target), dtype=bool)
+        winner[first] = True
+        winner |= shared
+        rows = rows[winner]
+        new_y = new_y[winner]
+        new_x = new_x[winner]
+        new_direction = new_direction[winner]
+        ants = ants[rows]
+
+        # march: leave pheromone on the old tile (unless colony or food), then move
+        old_y = y[rows]
+        old_x = x[rows]
+        marking = ~field.is_colony[old_y, old_x] & ~field.has_food[old_y, old_x]
+        with_food = has_food[rows] & marking
+        without_food = ~has_food[rows] & marking
+        colony = colony[rows]
+        field.deposit(1, (old_y[with_food], old_x[with_food]), board.params.deposit, colony[with_food] if field.colonies > 1 else 0)
+        field.deposit(0, (old_y[without_food], old_x[without_food]), board.params.deposit, colony[without_food] if field.colonies > 1 else 0)
+        if state.profiler is not None:
+            state.profiler.count("deposits", int(marking.sum()))
+        field.is_occupied[old_y, old_x] = False
+        entering = ~field.is_colony[new_y, new_x]
+        field.is_occupied[new_y[entering], new_x[entering]] = True
+
+        state.y[ants] = new_y
+        state.x[ants] = new_x
+        state.direction[ants] = new_direction
@@ -0,0 +1,88 @@
+from main import Board
+from recorder import EventRecorder
+import numpy as np
+import multiprocessing, statistics
+import matplotlib.pyplot as plt
+
+def run_replicate(task):
+    """
+    Worker function: simulates one board and returns its per-timestep counters.
+
+    'task' is (run, seed, time, board_kwargs). The result is (run, seed, collected, deposited)
+    where collected[t] and deposited[t] count the food picked up and brought home at timestep t.
+    Only these two small arrays are sent back to the parent process, never the board.
+    """
+    run, seed, time, board_kwargs = task
+    board = Board(seed=seed, **board_kwargs)
+    board.simulate(time)
+    collected = board.recorder.per_timestep(EventRecorder.COLLECTED)
+    deposited = board.recorder.per_timestep(EventRecorder.DEPOSITED)
+    return run, seed, collected, deposited
+
+def replicate_seeds(runs, seed = None):
+    """Distinct, reproducible seeds for 'runs' replicates, derived from a single base seed."""
+    children = np.random.SeedSequence(seed).spawn(runs)
+    return [int(child.generate_state(1)[0]) for child in children]
+
+def iter_ensemble(runs, time = 1000, seed = None, processes = None, **board_kwargs):
+    """
+    Runs 'runs' independent boards (built with board_kwargs) across a process pool and yields
+    (run, seed, collected, deposited) for each of them as soon as its worker finishes.
+    """
+    tasks = [(run, run_seed, time, board_kwargs) for run, run_seed in enumerate(replicate_seeds(runs, seed))]
+    with multiprocessing.Pool(processes) as pool:
+        for result in pool.imap_unordered(run_replicate, tasks):
+            yield result
+
+def run_ensemble(runs, time = 1000, seed = None, processes = None, **board_kwargs):
+    """Runs an ensemble of boards (see iter_ensemble) and collects it into an EnsembleResult."""
+    result = EnsembleResult(runs, time)
+    for run, run_seed, collected, deposited in iter_ensemble(runs, time, seed, processes, **board_kwargs):
+        result.add(run, run_seed, collected, deposited)
+    return result
+
+class EnsembleResult:
+    """
+    The per-timestep food counters of every run of an ensemble, with their mean and confidence
+    band across runs. Row r of 'collected' and 'deposited' holds run r, column t timestep t.
+    """
+    def __init__(self, runs, time):
+        self.seeds = np.zeros(runs, dtype=np.int64)
+        self.collected = np.zeros((runs, time + 1), dtype=np.int32)
+        self.deposited = np.zeros((runs, time + 1), dtype=np.int32)
+
+    def add(self, run, seed, collected, deposited):
+        self.seeds[run] = seed
+        self.collected[run] = collected
+        self.deposited[run] = deposited
+
+    def binned(self, kind = "deposited", window = 1):
+        """The counts of 'kind' ("deposited" or "collected") summed over windows of 'window' timesteps, for each run."""
+        counts = self.deposited if kind == "deposited" else self.collected
+        counts = counts[:, 1:]
+        num_windows = counts.shape[1] // window
+        return counts[:, :num_windows * window].reshape(len(counts), num_windows, window).sum(axis=2)
+
+    def summary(self, kind = "deposited", window = 1, confidence = 0.95):
+        """
+        Returns (mean, lower, upper) across runs for each window, where lower and upper bound
+        the normal-approximation confidence interval of the mean.
+        """
+        counts = self.binned(kind, window)
+        mean = counts.mean(axis=0)
+        if len(counts) < 2:
+            return mean, mean, mean
+        z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+        half_width = z * counts.std(axis=0, ddof=1) / np.sqrt(len(counts))
+        return mean, mean - half_width, mean + half_width
+
+    def plot(self, kind = "deposited", window = 100, confidence = 0.95):
+        """Plots the mean amount of food 'kind' per window of timesteps, with its confidence band"""
+        mean, lower, upper = self.summary(kind, window, confidence)
+        time = (np.arange(len(mean)) + 1) * window
+        plt.plot(time, mean)
+        plt.fill_between(time, lower, upper, alpha=0.3)
+        plt.xlabel("Time instance")
+        plt.ylabel(f"Amount of food {kind} per {window} timesteps")
+        plt.title(f"Amount of food {kind} over time ({len(self.seeds)} runs, {confidence:.0%} band)")
+        plt.show()
@@ -0,0 +1,96 @@
+from renderer import BoardRenderer
+import matplotlib.pyplot as plt
+import multiprocessing, os, shutil, subprocess, tempfile
+
+# frames in a video when the timesteps between snapshots are not given
+DEFAULT_FRAMES = 500
+
+def render_chunk(task):
+    """
+    Worker function: draws a run of consecutive frames to PNG files with one BoardRenderer.
+
+    'task' is (frames, directory, dpi, clim): 'frames' is a list of Frames or a ReplayFrames
+    (see replay.py), read one at a time, and 'clim' the fixed top of the food and home color
+    scales shared by every chunk. Returns the paths written, in frame order.
+    """
+    frames, directory, dpi, clim = task
+    plt.switch_backend("Agg")
+    renderer = None
+    paths = []
+    for frame in frames:
+        if renderer is None:
+            height, width = frame.food_pheromone.shape
+            renderer = BoardRenderer(width, height, blit=False, clim=clim)
+        path = os.path.join(directory, f"frame_{frame.t:08d}.png")
+        renderer.save(frame, path, dpi)
+        paths.append(path)
+    renderer.close()
+    return paths
+
+def global_clim(frames):
+    """The highest food and home pheromone of all 'frames', the tops of their color scales. The frames are read once, in order."""
+    food = home = 1e-9
+    for frame in frames:
+        food = max(food, float(frame.food_pheromone.max()))
+        home = max(home, float(frame.home_pheromone.max()))
+    return food, home
+
+def snapshot_stride(timesteps, frames = DEFAULT_FRAMES):
+    """The timesteps between snapshots which give about 'frames' frames over a run of 'timesteps'."""
+    return max(1, -(-timesteps // frames))
+
+def render_frames(frames, directory, processes = None, dpi = None):
+    """
+    Draws 'frames' (a list of Frames, e.g. board.snapshots, or a ReplayFrames, which each
+    worker reads from the replay file itself) to frame_<t>.png files in 'directory',
+    splitting them into one run of consecutive frames per worker process.
+    Every frame is drawn on the same color scales, up to the highest pheromone of any frame.
+    Returns the paths of the files in frame order.
+    """
+    os.makedirs(directory, exist_ok=True)
+    if not frames:
+        return []
+    clim = global_clim(frames)
+    processes = processes or os.cpu_count() or 1
+    size = -(-len(frames) // processes)
+    tasks = [(frames[start:start + size], directory, dpi, clim) for start in range(0, len(frames), size)]
+    paths = []
+    with multiprocessing.Pool(min(processes, len(tasks))) as pool:
+        for chunk in pool.imap(render_chunk, tasks):
+            paths.extend(chunk)
+    return paths
+
+def find_ffmpeg(path):
+    """
+    Returns the ffmpeg executable 'path' needs to be written with, or None for a GIF.
+    Raises a RuntimeError if it is needed but not installed.
+    """
+    if path.lower().endswith(".gif"):
+        return None
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("Exporting to anything but a GIF needs ffmpeg, which was not found.")
+    return ffmpeg
+
+def export_video(frames, path, fps = 20, processes = None, dpi = None):
+    """
+    Draws 'frames' in parallel (see render_frames) and joins them into 'path': a GIF (with
+    Pillow), or any other format, such as MP4, with ffmpeg, which must be installed.
+    """
+    ffmpeg = find_ffmpeg(path)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = render_frames(frames, directory, processes, dpi)
+        if not paths:
+            raise ValueError("There are no frames to export.")
+        if ffmpeg is None:
+            from PIL import Image
+            # the frames are opened one at a time as they are appended
+            rest = (Image.open(frame_path) for frame_path in paths[1:])
+            Image.open(paths[0]).save(path, save_all=True, append_images=rest, duration=1000 / fps, loop=0)
+            return path
+        # the frames are named by timestep, so they are numbered again for ffmpeg
+        for i, frame_path in enumerate(paths):
+            os.rename(frame_path, os.path.join(directory, f"{i:08d}.png"))
+        subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-framerate", str(fps), "-i", os.path.join(directory, "%08d.png"),
+                        "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p", path], check=True)
+    return path
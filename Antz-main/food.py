@@ -0,0 +1,169 @@
+import math
+import numpy as np
+
+RESPAWN_POLICIES = ("none", "same", "random")
+
+class FoodRegistry:
+    """
+    The food sources of a board, kept as arrays (one entry per source) with an index from every
+    tile to the source on it, so finding, taking from and drawing food never sweeps the board.
+
+    y, x: location of each source
+    remaining: units of food left, math.inf (the default) for a source that never runs out
+    capacity: units a source starts with, and is refilled to when it respawns
+    active: whether the source is on the board; a depleted source stays in the arrays, inactive
+    cell_to_source: (height * width) int32, the source on each tile (y * width + x), or -1
+
+    The tile flags (field.has_food) follow the registry: add, take and respawns set and clear
+    them, so food should always be placed through here rather than on the tiles.
+
+    respawn decides what happens to a depleted source, 'delay' timesteps later: "none" (it is
+    gone), "same" (it comes back where it was) or "random" (it comes back on a random tile of
+    'candidates', the cell ids food may be placed on, which has no food and is not blocked).
+    Random respawns draw from their own Generator, so the board's random numbers, and with them
+    the ants, are the same whatever the food does.
+    """
+    def __init__(self, field, quantity = math.inf, respawn = "none", delay = 0, rng = None):
+        if respawn not in RESPAWN_POLICIES:
+            raise ValueError(f"Unknown respawn policy {respawn!r}, expected one of {RESPAWN_POLICIES}.")
+        if respawn == "random" and rng is None:
+            raise ValueError("Random respawns need a random generator.")
+        self.field = field
+        self.quantity = quantity
+        self.respawn = respawn
+        self.delay = delay
+        self.rng = rng
+        self.candidates = np.zeros(0, dtype=np.int64)
+        self.y = np.zeros(0, dtype=np.int64)
+        self.x = np.zeros(0, dtype=np.int64)
+        self.remaining = np.zeros(0, dtype=np.float64)
+        self.capacity = np.zeros(0, dtype=np.float64)
+        self.active = np.zeros(0, dtype=bool)
+        self.cell_to_source = np.full(field.width * field.height, -1, dtype=np.int32)
+        # depleted sources waiting to respawn, as [timesteps left to wait, source]
+        self.pending = []
+        # counts every change of the sources' locations, for whoever caches them
+        self.version = 0
+
+    def __len__(self):
+        return int(np.count_nonzero(self.active))
+
+    @property
+    def finite(self):
+        """True if any source can run out."""
+        return bool(np.isfinite(self.capacity).any())
+
+    def add(self, y, x, quantity = None):
+        """Places a source of 'quantity' units (by default the registry's quantity) at (y, x) and returns its id."""
+        cell = y * self.field.width + x
+        if self.cell_to_source[cell] >= 0:
+            raise ValueError(f"There is already food at {(y, x)}.")
+        quantity = self.quantity if quantity is None else quantity
+        source = len(self.y)
+        self.y = np.append(self.y, y)
+        self.x = np.append(self.x, x)
+        self.remaining = np.append(self.remaining, quantity)
+        self.capacity = np.append(self.capacity, quantity)
+        self.active = np.append(self.active, True)
+        self.cell_to_source[cell] = source
+        self.field.has_food[y, x] = True
+        self.version += 1
+        return source
+
+    def source_at(self, y, x):
+        """The id of the source at (y, x), or -1."""
+        return int(self.cell_to_source[y * self.field.width + x])
+
+    def take(self, y, x):
+        """
+        Takes one unit of food from each source at locations (y, x), scalars or arrays of
+        distinct locations. Returns the ids of the sources this depleted.
+        """
+        sources = self.cell_to_source[np.asarray(y) * self.field.width + np.asarray(x)]
+        sources = np.atleast_1d(sources)
+        sources = sources[sources >= 0]
+        self.remaining[sources] -= 1
+        depleted = sources[self.remaining[sources] <= 0]
+        for source in depleted.tolist():
+            self.remove(source)
+            if self.respawn != "none":
+                self.pending.append([self.delay, source])
+        return depleted
+
+    def remove(self, source):
+        """Takes a source off the board."""
+        y, x = int(self.y[source]), int(self.x[source])
+        self.active[source] = False
+        self.remaining[source] = 0
+        self.cell_to_source[y * self.field.width + x] = -1
+        self.field.has_food[y, x] = False
+        self.version += 1
+
+    def update(self):
+        """
+        Respawns the sources which have waited their delay. Called by the board at the end of
+        every timestep, so a source depleted at timestep t is back at the end of timestep t + delay.
+        """
+        if not self.pending:
+            return
+        waiting = []
+        for entry in self.pending:
+            if entry[0] > 0:
+                entry[0] -= 1
+                waiting.append(entry)
+            elif not self.place(entry[1]):
+                waiting.append(entry)
+        self.pending = waiting
+
+    def place(self, source):
+        """Puts a depleted source back on the board, refilled. Returns False if there is nowhere to put it."""
+        width = self.field.width
+        if self.respawn == "same":
+            cell = int(self.y[source]) * width + int(self.x[source])
+            if self.cell_to_source[cell] >= 0:
+                return False
+        else:
+            free = self.candidates[(self.cell_to_source[self.candidates] < 0) & ~self.field.blocked.reshape(-1)[self.candidates]]
+            if len(free) == 0:
+                return False
+            cell = int(free[self.rng.integers(len(free))])
+        y, x = divmod(cell, width)
+        self.y[source] = y
+        self.x[source] = x
+        self.remaining[source] = self.capacity[source]
+        self.active[source] = True
+        self.cell_to_source[cell] = source
+        self.field.has_food[y, x] = True
+        self.version += 1
+        return True
+
+    def locations(self):
+        """(sources on the board, 2) array of their (y, x) locations, in the order they were added."""
+        active = np.flatnonzero(self.active)
+        return np.stack([self.y[active], self.x[active]], axis=1)
+
+    def state(self):
+        """The registry as a dict of settings and a dict of arrays, for Board.save_checkpoint."""
+        settings = {
+            "quantity": self.quantity, "respawn": self.respawn, "delay": self.delay, "pending": self.pending,
+            "rng": self.rng.bit_generator.state if self.rng is not None else None,
+        }
+        arrays = {
+            "y": self.y, "x": self.x, "remaining": self.remaining, "capacity": self.capacity,
+            "active": self.active, "candidates": self.candidates,
+        }
+        return settings, arrays
+
+    def restore(self, settings, arrays):
+        """Sets the registry back to a state() taken earlier."""
+        self.y, self.x = arrays["y"].astype(np.int64), arrays["x"].astype(np.int64)
+        self.remaining, self.capacity = arrays["remaining"].astype(np.float64), arrays["capacity"].astype(np.float64)
+        self.active = arrays["active"].astype(bool)
+        self.candidates = arrays["candidates"].astype(np.int64)
+        self.pending = [list(entry) for entry in settings["pending"]]
+        if settings["rng"] is not None:
+            self.rng.bit_generator.state = settings["rng"]
+        self.cell_to_source[:] = -1
+        active = np.flatnonzero(self.active)
+        self.cell_to_source[self.y[active] * self.field.width + self.x[active]] = active
+        self.version += 1
@@ -1,11 +1,25 @@
 from ant import *
 from tile import *
+from engine import BatchedEngine
+from parameters import Parameters
+from streams import RandomStream
+from recorder import EventRecorder
+from profiler import Profiler
+from food import FoodRegistry
+from diffusion import Diffusion
 import numpy as np
-import math, random, argparse
+import math, argparse, json, os, tempfile
+from renderer import BoardRenderer, Frame
 import matplotlib.pyplot as plt
-from matplotlib.offsetbox import OffsetImage, AnnotationBbox
-import seaborn as sns
-import matplotlib.colors as mcolors
+
+def read_only(array):
+    """A view of 'array' which cannot be written through."""
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+# The left, forward and right direction indices for an ant facing each direction
+FACING = [((d - 1) % 8, d, (d + 1) % 8) for d in range(8)]
 
 def tuple_add(tup_1, tup_2):
     """Helper functions that adds together two tuples of size 2."""
@@ -15,46 +29,115 @@ class Board:
     """
     The board represents the 2D grid which the ants, colony, and food operate on. Has methods
     which control the general simulation flow, from visualization to the update function.
+
+    engine picks how the ants are stepped: "reference" calls Ant.update for each ant in turn,
+    "batched" steps all of them at once with a BatchedEngine (sequential=True makes it follow
+    the reference's in-order semantics).
+
+    params holds the tunable Parameters (pheromone deposit and decay, exploit probability,
+    ants activated per timestep); the defaults are the hand-tuned values.
+
+    Every random choice (food placement, initial directions, the ants' decisions) comes from the
+    board's own numpy Generator, seeded with 'seed', so a run is determined by its seed.
+
+    The food collected and deposited is kept by an EventRecorder; pass recorder=EventRecorder(spill_dir)
+    to have it written to disk as the simulation goes.
+
+    The food sources are kept by a FoodRegistry (self.food). Each holds food_quantity units
+    (infinite by default); a source which runs out is taken off the board and, with respawn
+    "same" or "random", put back respawn_delay timesteps later (see food.py).
+
+    colonies, a list of (y, x) locations, makes one colony per entry instead of the single one
+    at (colony_y, colony_x) (or the center). Ant i belongs to colony i % len(colonies), starts
+    there and only follows and leaves its own colony's pheromone; self.colony is the first.
+
+    obstacles blocks tiles, no ant entering them: a boolean mask or the path of an image
+    (dark pixels are obstacles), scaled to the board (see tile.load_obstacles).
+
+    With params.diffusion_rate above 0 the pheromone diffuses to the tiles around it every
+    timestep, before decaying (see diffusion.py); diffusion_method picks how ("auto", "stencil"
+    or "fft"). Diffusion is not available with lazy decay.
+
+    initialize=False leaves the board empty (no colony, food or ants), for load_checkpoint to fill.
     """
-    def __init__(self, width = 15, height = 20, spawn_radius = 1, num_ants = 2, num_food = 1, colony_x = None, colony_y = None):
+    def __init__(self, width = 15, height = 20, spawn_radius = 1, num_ants = 2, num_food = 1, colony_x = None, colony_y = None,
+                 dtype = np.float64, decay_model = "multiplicative", lazy_decay = False,
+                 engine = "reference", sequential = False, params = None, seed = None, recorder = None,
+                 food_quantity = math.inf, respawn = "none", respawn_delay = 0,
+                 colonies = None, obstacles = None, diffusion_method = "auto", initialize = True):
         self.width = width
         self.height = height
         self.spawn_radius = spawn_radius
         self.num_ants = num_ants
         self.num_food = num_food
-        self.grid = np.ndarray((self.height, self.width), dtype=Tile)
+        self.dtype = dtype
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.stream = RandomStream(self.rng, num_ants)
+        self.params = params if params is not None else Parameters()
+        self.colonies = [tuple(colony) for colony in colonies] if colonies is not None else [(colony_y, colony_x)]
+        self.grid = TileField(self.width, self.height, dtype=dtype, decay_model=decay_model, lazy_decay=lazy_decay, colonies=len(self.colonies))
+        if obstacles is not None:
+            self.grid.set_blocked(load_obstacles(obstacles, self.height, self.width))
+        self.grid.decay_rate = self.params.decay_rate
+        self.grid.pheromone_floor = self.params.pheromone_floor
+        if self.params.diffusion_rate > 0:
+            if lazy_decay:
+                raise ValueError("Diffusion touches every tile each timestep, so it cannot be combined with lazy decay.")
+            self.grid.diffusion = Diffusion(self.params.diffusion_rate, self.params.diffusion_radius, diffusion_method)
         self.ants = np.ndarray((num_ants), dtype=Ant)
-        self.colony = (colony_y, colony_x)
+        self.ant_state = AntArrays(num_ants, self.grid, self.params)
+        # random respawns get their own generator, spawned from the seed without drawing from self.rng
+        food_rng = np.random.default_rng(self.rng.bit_generator.seed_seq.spawn(1)[0]) if respawn == "random" else None
+        self.food = FoodRegistry(self.grid, food_quantity, respawn, respawn_delay, food_rng)
+        self.ant_state.food = self.food
+        self.colony = self.colonies[0]
         self.t = 0
 
         self.num_activated = 0
-        self.activated_per_timestep = 2
+        self.activated_per_timestep = self.params.activated_per_timestep
 
         self.directions = [(1,0), (1,1), (0,1), (-1,1), (-1,0), (-1,-1), (0,-1), (1,-1)] #[(0,1), (1,1), (1,0), (1,-1), (0,-1), (-1,-1), (-1,0), (-1,1)]
 
-        self.ant_food_collection_data = []
-        self.ant_food_deposit_data = []
+        self.recorder = recorder if recorder is not None else EventRecorder()
+        self.renderer = None
+        self.snapshots = []
+        # objects whose on_update(board) is called after every timestep of simulate, such as a replay.ReplayWriter
+        self.observers = []
+
+        if engine == "reference":
+            self.engine = None
+        elif engine == "batched":
+            self.engine = BatchedEngine(self, sequential=sequential)
+        else:
+            raise ValueError(f"Unknown engine {engine!r}, expected 'reference' or 'batched'.")
 
-        self.initialize_board()
+        if initialize:
+            self.initialize_board()
 
     def initialize_board(self):
         """
         Initializes a board with a colony, food, and ants.
+
+        The tiles themselves are stored as arrays in self.grid (a TileField), so there is
+        nothing to allocate per tile.
         """
-        for x in range(self.width):
-            for y in range(self.height):
-                self.grid[y][x] = Tile(x,y)
         self.add_colony()
         self.add_food()
         self.add_ants()
 
     def add_colony(self):
-        """Adds a colony to the board"""
-        if self.colony == (None, None):
-            self.colony = self.get_center_location(self.width, self.height)
-        elif self.colony[0] == None or self.colony[1] == None:
-            raise Exception("You must specify both an x and a y (or neither).")
-        self.grid[self.colony].is_colony = True
+        """Adds the colonies to the board"""
+        for k, colony in enumerate(self.colonies):
+            if colony == (None, None):
+                colony = self.get_center_location(self.width, self.height)
+            elif colony[0] == None or colony[1] == None:
+                raise Exception("You must specify both an x and a y (or neither).")
+            if self.grid.blocked[colony]:
+                raise Exception(f"The colony at {colony} is on an obstacle.")
+            self.colonies[k] = colony
+            self.grid.add_colony(colony, k)
+        self.colony = self.colonies[0]
 
     def add_food(self):
         """Adds food to the board, if possible"""
@@ -63,30 +146,36 @@ class Board:
             raise Exception("The exclusion radius is too large for food to be placed.")
         elif len(all_locations) < self.num_food:
             raise Exception("There are not enough locations to place food.")
-        food_locations = random.sample(list(all_locations), self.num_food)
+        food_locations = self.rng.choice(sorted(all_locations), self.num_food, replace=False)
+        self.food.candidates = np.array(sorted(all_locations), dtype=np.int64)
         for loc in food_locations:
             x = loc % self.width
             y = loc // self.width
             # set tile to be a food source
-            self.grid[y][x].set_has_food(True)
+            self.food.add(int(y), int(x))
 
     def add_ants(self):
         """Adds ants to the board."""
-        self.ants = [Ant(self.grid[self.colony]) for i in range(self.num_ants)]
+        directions = self.rng.integers(0, 8, size=self.num_ants)
+        colonies = len(self.colonies)
+        self.ants = [Ant(self.grid[self.colonies[i % colonies]], self.ant_state, i, int(directions[i])) for i in range(self.num_ants)]
+        self.ant_state.colony[:] = np.arange(self.num_ants) % colonies
 
     def get_valid_food_locations(self):
         """
         Helper function for add_food.
 
-        Food can only be placed within the grid and cannot be placed within a certain X by X
-        square surrounding the colony. Thus, this function returns a set of all possible
-        locations food could spawn in. 
+        Food can only be placed within the grid, off the obstacles, and cannot be placed within
+        a certain X by X square surrounding any colony. Thus, this function returns a set of all
+        possible locations food could spawn in. 
         """
         all_locations = set(range(self.width * self.height))
-        for y in range(max(self.colony[0] - self.spawn_radius, 0), min(self.colony[0] + self.spawn_radius + 1, self.height - 1)):
-            for x in range(max(self.colony[1] - self.spawn_radius, 0), min(self.colony[1] + self.spawn_radius + 1, self.width - 1)):
-                location = x + y * self.width
-                all_locations.remove(location)
+        for colony in self.colonies:
+            for y in range(max(colony[0] - self.spawn_radius, 0), min(colony[0] + self.spawn_radius + 1, self.height - 1)):
+                for x in range(max(colony[1] - self.spawn_radius, 0), min(colony[1] + self.spawn_radius + 1, self.width - 1)):
+                    location = x + y * self.width
+                    all_locations.discard(location)
+        all_locations -= set(np.flatnonzero(self.grid.blocked).tolist())
         return all_locations
 
     def get_center_location(self, width, height):
@@ -98,14 +187,18 @@ class Board:
         return (math.floor(height / 2), math.floor(width / 2))
 
     def get_food_locs(self):
-        """Returns a list of tuples representing the location of each food"""
-        food = []
-        for i in range(self.width):
-            for j in range(self.height):
-                if self.grid[j][i].get_has_food():
-                    food.append((j,i))
-        return food
+        """Returns a list of tuples representing the location of each food, from the food registry"""
+        return [(int(y), int(x)) for y, x in self.food.locations().tolist()]
     
+    @property
+    def neighbor_table(self):
+        """
+        (cells, 8) int32 table of neighboring cell ids (y * width + x) in the order of
+        self.directions, with -1 for locations off the board or blocked. Precomputed by the grid
+        and rebuilt whenever the board geometry or the blocked tiles change.
+        """
+        return self.grid.neighbor_table(self.directions)
+
      # Return an array of the unoccupied neighboring tiles at the current direction
     def get_neighboring_tiles(self, loc, direction):
         """
@@ -114,43 +207,74 @@ class Board:
 
         Written by Yang
         """
+        if self.ant_state.profiler is not None:
+            self.ant_state.profiler.count("neighbor_lookups")
+        neighbors = self.neighbor_table[loc[0] * self.width + loc[1]].tolist()
+        occupied = self.grid.is_occupied.reshape(-1)
         neighboring_tiles = [None, None, None]
-        if self.is_location_empty(tuple_add(loc, self.directions[direction - 1])):
-            neighboring_tiles[0] = self.grid[tuple_add(loc, self.directions[direction - 1])]
-        if self.is_location_empty(tuple_add(loc, self.directions[direction])):
-             neighboring_tiles[1] = self.grid[tuple_add(loc, self.directions[direction])]
-        if self.is_location_empty(tuple_add(loc, self.directions[(direction + 1) % 8])):
-            neighboring_tiles[2] = self.grid[tuple_add(loc, self.directions[(direction + 1) % 8])]
-         
+        for i, d in enumerate(FACING[direction]):
+            cell = neighbors[d]
+            if cell >= 0 and not occupied[cell]:
+                neighboring_tiles[i] = self.grid[divmod(cell, self.width)]
         return neighboring_tiles
     
+    @property
+    def profiler(self):
+        """The Profiler collecting timings and counters, or None (the default) to collect nothing."""
+        return self.ant_state.profiler
+
+    @profiler.setter
+    def profiler(self, profiler):
+        self.ant_state.profiler = profiler
+
     def is_location_empty(self, loc):
         """
-        Confirms a tile at a specific location exists and is not occupied by an ant
+        Confirms a tile at a specific location exists, is not blocked and is not occupied by an ant
         """
-        return (0 <= loc[0] < self.height) and (0 <= loc[1] < self.width) and (not self.grid[loc].get_is_occupied())
+        return (0 <= loc[0] < self.height) and (0 <= loc[1] < self.width) and not (self.grid.is_occupied[loc] or self.grid.blocked[loc])
 
     def get_home_pheromone_grid(self):
-        """Computes a 2D grid of home pheromone levels."""
-        home_pheromone = np.vectorize(lambda x: x.get_home_pheromone())(self.grid)
-        return home_pheromone
+        """
+        Returns the 2D grid of home pheromone levels.
+
+        This is a read-only view of the board's own array (no copy), which changes as the
+        board is simulated; copy it to keep or modify it. With lazy decay the whole grid is
+        brought up to date first. With several colonies it is a new array holding the highest
+        level of any colony, in one operation over the layers.
+        """
+        self.grid.synchronize()
+        if self.grid.colonies > 1:
+            return self.grid.home_layers.max(axis=0)
+        return read_only(self.grid.home_pheromone)
                 
     def get_food_pheromone_grid(self):
-        """Computes a 2D grid of food pheromone levels."""
-        food_pheromone = np.vectorize(lambda x: x.get_food_pheromone())(self.grid)
-        return food_pheromone
+        """
+        Returns the 2D grid of food pheromone levels.
+
+        This is a read-only view of the board's own array (no copy), which changes as the
+        board is simulated; copy it to keep or modify it. With lazy decay the whole grid is
+        brought up to date first. With several colonies it is a new array holding the highest
+        level of any colony, in one operation over the layers.
+        """
+        self.grid.synchronize()
+        if self.grid.colonies > 1:
+            return self.grid.food_layers.max(axis=0)
+        return read_only(self.grid.food_pheromone)
 
     def __str__(self):
-        """The board represented as a string. Useful alternative to matplotlib"""
-        representation = " _" * self.width + "\n"
-        for y in range(self.height):
-            representation += "|"
-            for x in range(self.width):
-                representation += str(self.grid[y][x]) + " "
-            representation = representation[:-1]
-            representation += "|\n"
-        representation += (" _" * self.width)
-        return representation
+        """
+        The board represented as a string. Useful alternative to matplotlib (terminal.py draws
+        it live). Each tile is shown as Tile.__str__ shows it, but built from whole arrays.
+        """
+        grid = self.grid
+        grid.synchronize()
+        cells = np.rint(grid.food_pheromone).astype(np.int64).astype(str)
+        cells[grid.is_occupied] = "A"
+        cells[grid.is_colony] = "C"
+        cells[grid.has_food] = "F"
+        border = " _" * self.width
+        rows = ("|" + " ".join(row) + "|" for row in cells.tolist())
+        return border + "\n" + "\n".join(rows) + "\n" + border
 
     def activate_ants(self):
         """
@@ -173,118 +297,245 @@ class Board:
         For each timestep:
         1. activates ants which have not started moving
         2. calls the update function of each ant (rotating, moving)
-        3. calls the update function of each tile (pheromone decay)
+        3. decays the pheromone of every tile (one array operation per layer, or only a
+           clock tick with lazy decay) and respawns depleted food
+
+        With a profiler set (see profiler.py), each step is timed.
         """
-        # 1. Activation
+        if self.ant_state.profiler is not None:
+            self.ant_state.profiler.profile_update(self)
+            return
+        self.update_activation()
+        self.update_ant_phase()
+        self.update_tiles()
+
+    def update_activation(self):
+        """Step 1 of the update function."""
         if self.num_activated < self.num_ants:
             self.activate_ants()
-        # 2. Ant Update
+
+    def update_ant_phase(self):
+        """Step 2 of the update function, recording the food collected and deposited."""
+        self.ant_state.draws = self.stream.next_step()
+        if self.engine is None:
+            collected, deposited = self.update_ants()
+        else:
+            collected, deposited = self.update_ants_batched()
+        self.recorder.record(self.t, collected, deposited)
+
+    def update_tiles(self):
+        """Step 3 of the update function."""
+        self.grid.diffuse()
+        self.grid.decay()
+        self.food.update()
+
+    def update_ants(self):
+        """
+        Step 2 of the update function: calls the update function of each ant in turn.
+        Returns the (ys, xs) locations where food was collected and where it was deposited.
+        """
+        collected = ([], [])
+        deposited = ([], [])
         for ant in self.ants:
             ant_location = (ant.current_tile.y, ant.current_tile.x)
             neighboring_tiles = self.get_neighboring_tiles(ant_location, ant.direction)
             food_code = ant.update(neighboring_tiles)
             # aside (data collection)
             if (food_code == 0):
-                self.ant_food_collection_data.append([self.t, ant_location])
+                collected[0].append(ant_location[0])
+                collected[1].append(ant_location[1])
             elif (food_code == 1):
-                self.ant_food_deposit_data.append([self.t, ant_location])
-        # 3. Tile Update
-        for x in range(self.width):
-            for y in range(self.height):
-                self.grid[y][x].update()
+                deposited[0].append(ant_location[0])
+                deposited[1].append(ant_location[1])
+        return collected, deposited
 
-    def simulate(self, time = 100, animate = False):
+    def update_ants_batched(self):
+        """
+        Step 2 of the update function when the ants are stepped by a BatchedEngine.
+        Ants picking up or dropping food do not move, so their current location is returned.
+        """
+        collected, deposited = self.engine.step()
+        if len(collected):
+            self.food.take(self.ant_state.y[collected], self.ant_state.x[collected])
+        return ((self.ant_state.y[collected], self.ant_state.x[collected]),
+                (self.ant_state.y[deposited], self.ant_state.x[deposited]))
+
+    @property
+    def ant_food_collection_data(self):
+        """Every food collection as a [t, (y, x)] list, built from the recorder."""
+        return self.recorder.event_list(EventRecorder.COLLECTED)
+
+    @property
+    def ant_food_deposit_data(self):
+        """Every food deposit as a [t, (y, x)] list, built from the recorder."""
+        return self.recorder.event_list(EventRecorder.DEPOSITED)
+
+    def simulate(self, time = 100, animate = False, every = 1, snapshot_every = None, stop = None):
         """
         Runs the update function for a certain amount of timesteps. If animate,
-        then at each update a matplotlib plot will display to the screen with a status.
+        then every 'every' updates a matplotlib plot will display to the screen with a status.
+
+        With snapshot_every=k, a Frame is added to self.snapshots every k timesteps, so the
+        run can be drawn afterwards (see export.py) without the simulation waiting on it. Each
+        is a full copy of the pheromone, so for long runs or large boards record the run with
+        a replay.ReplayWriter instead and draw a ReplayFrames of it, as main.py --export does.
+
+        Every object in self.observers has its on_update(board) called after each timestep.
+
+        With stop (a stopping.SteadyStateCriterion), the food deposited at each timestep is
+        checked against it, the run ends as soon as it says so, and a StopReport (why, and at
+        which timestep) is returned.
         """
         for t in range(time):
             self.t += 1
             self.update()
-            if animate:
+            for observer in self.observers:
+                observer.on_update(self)
+            if animate and self.t % every == 0:
                 self.visualization(animate)
+            if snapshot_every and self.t % snapshot_every == 0:
+                self.snapshots.append(self.get_frame())
+            if stop is not None:
+                reason = stop.check(self.recorder.latest[EventRecorder.DEPOSITED])
+                if reason is not None:
+                    return stop.report(reason, self.t, t + 1)
+        if stop is not None:
+            return stop.report(None, self.t, time)
+
+    def save_checkpoint(self, path):
+        """
+        Writes everything needed to carry on the simulation to one compressed .npz file: the
+        tile and ant arrays, the random generator and stream (its current block is drawn again
+        on loading rather than stored), t, num_activated, the food sources and the recorded
+        food data. Food data a spilling EventRecorder already wrote to disk is not read back:
+        the checkpoint names its spill files, which must be kept to load it. The file is
+        written next to 'path' and then moved over it, so an interrupted save leaves the
+        previous checkpoint intact. 'path' may also be a binary file object (e.g. an
+        io.BytesIO, to send a board to another process), which is written directly.
+        """
+        grid = self.grid
+        settings = {
+            "width": self.width, "height": self.height, "spawn_radius": self.spawn_radius, "num_ants": self.num_ants,
+            "num_food": self.num_food, "colonies": [[int(y), int(x)] for y, x in self.colonies], "dtype": np.dtype(self.dtype).name,
+            "decay_model": grid.decay_model, "lazy_decay": grid.lazy_decay,
+            "diffusion_method": grid.diffusion.method if grid.diffusion is not None else "auto",
+            "engine": "reference" if self.engine is None else "batched",
+            "sequential": self.engine is not None and self.engine.sequential,
+            "params": self.params.as_dict(), "seed": self.seed, "t": self.t, "num_activated": self.num_activated,
+            "activated_per_timestep": self.activated_per_timestep, "clock": grid.clock,
+            "decay_rate": grid.decay_rate, "pheromone_floor": grid.pheromone_floor,
+            "decay_constants": [grid.a_f, grid.b_f, grid.c_f, grid.a_h, grid.b_h, grid.c_h],
+            "rng": self.rng.bit_generator.state, "stream_position": self.stream.position,
+            "stream_block_state": self.stream.block_state, "stream_block_steps": len(self.stream.block),
+        }
+        food_settings, food_arrays = self.food.state()
+        settings["food"] = food_settings
+        settings["recorder"], recorder_arrays = self.recorder.state()
+        arrays = {
+            "settings": np.array(json.dumps(settings)),
+            "home_pheromone": grid.home_layers, "food_pheromone": grid.food_layers, "has_food": grid.has_food,
+            "is_colony": grid.is_colony, "colony_map": grid.colony_map, "is_occupied": grid.is_occupied, "blocked": grid.blocked,
+            "ant_y": self.ant_state.y, "ant_x": self.ant_state.x, "ant_direction": self.ant_state.direction,
+            "ant_has_food": self.ant_state.has_food, "ant_activated": self.ant_state.activated, "ant_colony": self.ant_state.colony,
+        }
+        arrays.update({"source_" + name: array for name, array in food_arrays.items()})
+        arrays.update(recorder_arrays)
+        if grid.lazy_decay:
+            arrays["last_update"] = grid.last_update
+            arrays["on_initial_curve"] = grid.on_initial_curve
+        if not isinstance(path, (str, os.PathLike)):
+            np.savez_compressed(path, **arrays)
+            return
+        temporary = os.fspath(path) + ".tmp"
+        with open(temporary, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load_checkpoint(cls, path, recorder = None):
+        """
+        Returns the board saved by save_checkpoint at 'path' (or in a binary file object), ready
+        to be simulated further. Its recorded food data goes into 'recorder' if given (e.g. to spill it to disk).
+        """
+        with np.load(path, allow_pickle=False) as data:
+            settings = json.loads(str(data["settings"]))
+            board = cls(settings["width"], settings["height"], settings["spawn_radius"], settings["num_ants"], settings["num_food"],
+                        colonies=settings["colonies"], dtype=np.dtype(settings["dtype"]),
+                        decay_model=settings["decay_model"], lazy_decay=settings["lazy_decay"], engine=settings["engine"],
+                        sequential=settings["sequential"], params=Parameters(**settings["params"]), seed=settings["seed"],
+                        recorder=recorder, food_quantity=settings["food"]["quantity"], respawn=settings["food"]["respawn"],
+                        respawn_delay=settings["food"]["delay"],
+                        diffusion_method=settings["diffusion_method"], initialize=False)
+            grid = board.grid
+            grid.home_layers[...] = data["home_pheromone"]
+            grid.food_layers[...] = data["food_pheromone"]
+            grid.has_food[...] = data["has_food"]
+            grid.is_colony[...] = data["is_colony"]
+            grid.colony_map[...] = data["colony_map"]
+            grid.is_occupied[...] = data["is_occupied"]
+            grid.set_blocked(data["blocked"])
+            if grid.lazy_decay:
+                grid.last_update[...] = data["last_update"]
+                grid.on_initial_curve[...] = data["on_initial_curve"]
+            grid.clock = settings["clock"]
+            grid.decay_rate = settings["decay_rate"]
+            grid.pheromone_floor = settings["pheromone_floor"]
+            grid.a_f, grid.b_f, grid.c_f, grid.a_h, grid.b_h, grid.c_h = settings["decay_constants"]
+            board.food.restore(settings["food"], {name[7:]: data[name] for name in data.files if name.startswith("source_")})
+
+            # the ants are made first, as an Ant resets its entry of the arrays
+            y = data["ant_y"]
+            x = data["ant_x"]
+            board.ants = [Ant(grid[(int(y[i]), int(x[i]))], board.ant_state, i, 0) for i in range(board.num_ants)]
+            board.ant_state.y[...] = y
+            board.ant_state.x[...] = x
+            board.ant_state.direction[...] = data["ant_direction"]
+            board.ant_state.has_food[...] = data["ant_has_food"]
+            board.ant_state.activated[...] = data["ant_activated"]
+            board.ant_state.colony[...] = data["ant_colony"]
+
+            board.rng.bit_generator.state = settings["rng"]
+            if settings["stream_block_state"] is not None:
+                board.stream.redraw(settings["stream_block_state"], settings["stream_block_steps"])
+            board.stream.position = settings["stream_position"]
+            board.t = settings["t"]
+            board.num_activated = settings["num_activated"]
+            board.activated_per_timestep = settings["activated_per_timestep"]
+            board.recorder.restore(data["counts"], data["events"], settings.get("recorder"))
+        return board
+
+    def get_frame(self):
+        """A Frame (see renderer.py) holding copies of everything the visualization draws at this timestep."""
+        return Frame(self.t, self.get_food_pheromone_grid().copy(), self.get_home_pheromone_grid().copy(),
+                     self.ant_state.y.copy(), self.ant_state.x.copy(), self.ant_state.direction.copy(),
+                     self.ant_state.has_food.copy(), self.get_food_locs(), self.colony, list(self.colonies),
+                     self.grid.blocked if self.grid.blocked.any() else None)
 
     def visualization(self, animate = False):
         """
         Using matplotlib, plots the ants, food, pheromone levels on the screen.
 
-        If animate=True, will continuously create new matplotlib plots to show ant movement. This is
+        The board keeps one BoardRenderer, so every call draws into the same figure. If
+        animate=True, the figure stays open and each call updates it in place. This is
         bare-bones animation and is primarily for testing to investigate ant behavior.
+        Otherwise the figure is drawn in full (no blitting) and shown with plt.show().
 
         Based on Tom Finzell's code
         """
-
-        # images
-        ants = [f"./images/ant{i}.png" for i in range(8)]
-        bread = "./images/bread.png" #https://www.dreamstime.com/stock-illustration-flat-design-single-bread-slice-icon-vector-illustration-image79060025
-        anthill = "./images/anthill.png" #https://www.dreamstime.com/stock-illustration-flat-design-single-bread-slice-icon-vector-illustration-image79060025
-
-        ant_list = self.ants
-        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(8, 8))
-
-        ant_imgs = [plt.imread(ant) for ant in ants]
-        bread_img = plt.imread(bread)
-        anthill_img = plt.imread(anthill)
-        
-        zoom_val = 0.12  # Zoom dictates how big the images should appear on the screen
-                         # All images are 200 x 200 so 
-
-        cmap1 = mcolors.LinearSegmentedColormap.from_list("red_map", ["white", "red"])
-        cmap2 = mcolors.LinearSegmentedColormap.from_list("blue_map", ["white", "blue"])
-
-        # pheromone heatmaps
-        sns.heatmap(self.get_food_pheromone_grid(), ax=ax1, cmap=cmap1, cbar=True)
-        ax1.set_title('Food Pheromone')
-        sns.heatmap(self.get_home_pheromone_grid(), ax=ax2, cmap=cmap2, cbar=True)
-        ax2.set_title('Home Pheromone')
-
-        # plotting the ants at the correct with possible food in hand
-        bread_imagebox = OffsetImage(bread_img, zoom=zoom_val / 2) 
-        for ant in ant_list:
-            x_ant_image_coord = ant.current_tile.x + 0.5
-            y_ant_image_coord = ant.current_tile.y + 0.5
-            imagebox = OffsetImage(ant_imgs[ant.direction], zoom=zoom_val)
-            ab = AnnotationBbox(imagebox, (x_ant_image_coord, y_ant_image_coord), frameon=False)
-            ax1.add_artist(ab)
-            ab = AnnotationBbox(imagebox, (x_ant_image_coord, y_ant_image_coord), frameon=False)
-            ax2.add_artist(ab)
-            if ant.has_food:
-                food_in_hand = AnnotationBbox(bread_imagebox, (x_ant_image_coord + 0.2, y_ant_image_coord - 0.2), frameon=False)
-                ax1.add_artist(food_in_hand)
-                food_in_hand = AnnotationBbox(bread_imagebox, (x_ant_image_coord + 0.2, y_ant_image_coord - 0.2), frameon=False)
-                ax2.add_artist(food_in_hand)
-
-        # plotting the food
-        food_locs = board.get_food_locs()
-        for food in food_locs:
-            bread_imagebox = OffsetImage(bread_img, zoom=zoom_val) 
-            ab = AnnotationBbox(bread_imagebox, (food[1] + 0.5, food[0] + 0.5), frameon=False)
-            ax1.add_artist(ab)
-            ab = AnnotationBbox(bread_imagebox, (food[1] + 0.5, food[0] + 0.5), frameon=False)
-            ax2.add_artist(ab)
-
-        # plotting the anthill
-        anthill_imagebox = OffsetImage(anthill_img, zoom=zoom_val) 
-        ab = AnnotationBbox(anthill_imagebox, (board.colony[1] + 0.5, board.colony[0] + 0.5), frameon=False)
-        ax1.add_artist(ab)
-        ab = AnnotationBbox(anthill_imagebox, (board.colony[1] + 0.5, board.colony[0] + 0.5), frameon=False)
-        ax2.add_artist(ab)
-
-        # if animating, the display only shows for 0.15 seconds
+        if self.renderer is None:
+            self.renderer = BoardRenderer(self.width, self.height, blit=animate)
         if animate:
-            plt.show(block=False)
-            plt.pause(0.15)
-            plt.close()
+            self.renderer.show(self.get_frame())
         else:
+            self.renderer.stop_blitting()
+            self.renderer.update(self.get_frame())
             plt.show()
 
     def plot_food_collection_data(self):
         """At each timestep, plots the number of food collected"""
-        food_time_data = np.zeros(self.t)
+        food_time_data = self.recorder.per_timestep(EventRecorder.COLLECTED)
 
-        for time in self.ant_food_collection_data:
-            food_time_data[time[0]] += 1
-        
+        plt.figure()
         plt.plot(food_time_data, marker='o',linestyle='')
         plt.xlabel("Time instance")
         plt.ylabel("Amount of food collected")
@@ -293,11 +544,9 @@ class Board:
 
     def plot_food_deposit_data(self):
         """At each timestep, plots the number of food deposited at the colony"""
-        food_time_data = np.zeros(self.t)
-        
-        for time in self.ant_food_deposit_data:
-            food_time_data[time[0]] += 1
-        
+        food_time_data = self.recorder.per_timestep(EventRecorder.DEPOSITED)
+
+        plt.figure()
         plt.plot(food_time_data, marker='o',linestyle='')
         plt.xlabel("Time instance")
         plt.ylabel("Amount of food deposited")
@@ -306,8 +555,9 @@ class Board:
 
     def hist_food_deposit_data(self):
         """Cleaner histogram for displaying food deposit information"""
-        food_timestamps = [food[0] for food in self.ant_food_deposit_data]
-        plt.hist(food_timestamps, bins=20)
+        counts, edges = self.recorder.histogram(EventRecorder.DEPOSITED, bins=20)
+        plt.figure()
+        plt.stairs(counts, edges, fill=True)
         plt.xlabel("Time instance")
         plt.ylabel("Amount of food deposited")
         plt.title("Amount of food deposited over time")        
@@ -315,8 +565,9 @@ class Board:
 
     def hist_food_collection_data(self):
         """Cleaner histogram for displaying food collection information"""
-        food_timestamps = [food[0] for food in self.ant_food_collection_data]
-        plt.hist(food_timestamps, bins=20)
+        counts, edges = self.recorder.histogram(EventRecorder.COLLECTED, bins=20)
+        plt.figure()
+        plt.stairs(counts, edges, fill=True)
         plt.xlabel("Time instance")
         plt.ylabel("Amount of food collected")
         plt.title("Amount of food collected over time")        
@@ -332,13 +583,139 @@ if __name__ == "__main__":
     parser.add_argument("-a", "--ants", type=int, help="number of ants", default = 6)
     parser.add_argument("-f", "--food", type=int, help="number of food", default = 3)
     parser.add_argument("-d", "--dimensions", type=int, help="first argument width of grid, second argument height of grid", nargs = 2, default=[15, 15])
+    parser.add_argument("--colonies", help="locations of the colonies as y,x pairs, the ants being shared out between them (default: one at the center)", nargs = "+", default = None)
+    parser.add_argument("--obstacles", help="image (dark pixels are blocked) or .npy boolean mask of obstacles, scaled to the grid", default = None)
+    parser.add_argument("-q", "--food-quantity", type=float, help="units of food in each source (default: infinite)", default = math.inf)
+    parser.add_argument("--respawn", choices=["none", "same", "random"], help="what happens to a food source which runs out", default = "none")
+    parser.add_argument("--respawn-delay", type=int, help="timesteps before a food source which ran out respawns", default = 0)
+    parser.add_argument("--diffusion", type=float, help="share of the way each tile's pheromone moves towards the mean of its neighbors every timestep (default: 0, none)", default = 0.0)
+    parser.add_argument("--diffusion-radius", type=int, help="with --diffusion, how many tiles away the neighbors reach", default = 1)
+    parser.add_argument("--diffusion-method", choices=["auto", "stencil", "fft"], help="with --diffusion, how it is computed (default: auto, the FFT for wide radii)", default = "auto")
     parser.add_argument("-t", "--timesteps", type=int, help="timesteps to run simulation for", default = 100000)
     parser.add_argument("-v", "--visualize", help="shows animation of ants moving around the grid", action="store_true")
+    parser.add_argument("--profile", help="print where the time went and what the ants did after simulating", action="store_true")
+    parser.add_argument("--terminal", nargs="?", const="food", choices=["food", "home"], help="draw the run live in the terminal as text, showing the food (default) or home pheromone", default = None)
+    parser.add_argument("--every", type=int, help="with --visualize or --terminal, only draw every k-th timestep", default = 1)
+    parser.add_argument("--export", help="file (.gif, or .mp4 with ffmpeg) to draw the run to after simulating", default = None)
+    parser.add_argument("--snapshot-every", type=int, help="with --export, timesteps between the frames of the video (default: about 500 frames over --timesteps)", default = None)
+    parser.add_argument("-e", "--ensemble", type=int, help="number of independent runs to simulate and summarize instead of a single run", default = None)
+    parser.add_argument("-p", "--processes", type=int, help="number of worker processes for --ensemble and --export (default: all cores)", default = None)
+    parser.add_argument("-w", "--workers", type=int, help="split the board into this many horizontal strips, each stepped by its own process", default = None)
+    parser.add_argument("--checkpoint", help="file to save the simulation to every --checkpoint-every timesteps and at the end", default = None)
+    parser.add_argument("--checkpoint-every", type=int, help="timesteps between checkpoints", default = 10000)
+    parser.add_argument("--resume", help="checkpoint file to carry on from, up to a total of --timesteps", default = None)
+    parser.add_argument("--spill-dir", help="folder to write the recorded food data to as it fills up, so that memory use stays flat on long runs", default = None)
+    parser.add_argument("--record", help="file to record the run to, to be replayed with replay.py", default = None)
+    parser.add_argument("--keyframe-every", type=int, help="with --record, timesteps between full keyframes", default = 1000)
+    parser.add_argument("--analytics", help="file to write the trips of the ants to after simulating (.csv, or .npz with the per-ant and throughput tables too)", default = None)
+    parser.add_argument("--early-stop", help="stop once the food deposited per --stop-window timesteps has settled, or stopped", action="store_true")
+    parser.add_argument("--stop-window", type=int, help="with --early-stop, timesteps per window of deposits", default = 1000)
+    parser.add_argument("--stop-tolerance", type=float, help="with --early-stop, relative change of the mean deposits per window counted as settled", default = 0.05)
+    parser.add_argument("-s", "--seed", type=int, help="seed of the simulation (with --ensemble, the base seed the per-run seeds are derived from)", default = None)
     args = parser.parse_args()
 
+    colonies = None
+    if args.colonies:
+        try:
+            colonies = [tuple(int(value) for value in colony.split(",")) for colony in args.colonies]
+        except ValueError:
+            parser.error("--colonies takes y,x pairs, e.g. --colonies 5,5 20,30")
+        if any(len(colony) != 2 for colony in colonies):
+            parser.error("--colonies takes y,x pairs, e.g. --colonies 5,5 20,30")
+
+    # the settings of a new board, shared by the runs of an ensemble
+    board_kwargs = dict(num_ants = args.ants, num_food = args.food, spawn_radius = 4, width = args.dimensions[0], height = args.dimensions[1],
+                        food_quantity = args.food_quantity, respawn = args.respawn, respawn_delay = args.respawn_delay,
+                        colonies = colonies, obstacles = args.obstacles, diffusion_method = args.diffusion_method,
+                        params = Parameters(diffusion_rate = args.diffusion, diffusion_radius = args.diffusion_radius))
+
+    if args.ensemble:
+        from ensemble import run_ensemble
+        result = run_ensemble(args.ensemble, args.timesteps, seed = args.seed, processes = args.processes, **board_kwargs)
+        window = max(args.timesteps // 20, 1)
+        result.plot("deposited", window)
+        result.plot("collected", window)
+        raise SystemExit
+
+    if args.workers and (args.visualize or args.terminal or args.export or args.profile or args.record or args.analytics or args.early_stop or math.isfinite(args.food_quantity)):
+        parser.error("--workers cannot be combined with --visualize, --terminal, --export, --profile, --record, --analytics, --early-stop or --food-quantity")
+    if args.workers and args.colonies and len(args.colonies) > 1:
+        parser.error("--workers cannot be combined with more than one colony")
+    if args.workers and args.diffusion > 0:
+        parser.error("--workers cannot be combined with --diffusion")
+
+    if args.export and args.resume:
+        parser.error("--export cannot be combined with --resume, as the frames of the run before the checkpoint are not saved in it")
+    if args.export:
+        from export import export_video, find_ffmpeg, snapshot_stride
+        find_ffmpeg(args.export)  # fail before simulating rather than after
+        if args.snapshot_every is None:
+            args.snapshot_every = snapshot_stride(args.timesteps)
+
     # simulate
-    board = Board(num_ants = args.ants, num_food = args.food, spawn_radius = 4, width = args.dimensions[0], height = args.dimensions[1])
-    board.simulate(args.timesteps, args.visualize)
+    recorder = EventRecorder(args.spill_dir) if args.spill_dir else None
+    if args.resume:
+        board = Board.load_checkpoint(args.resume, recorder = recorder)
+    else:
+        board = Board(seed = args.seed, recorder = recorder, **board_kwargs)
+    if args.profile:
+        board.profiler = Profiler()
+    if args.record or args.export:
+        from replay import ReplayWriter
+        record_path = args.record
+        if record_path is None:
+            # --export alone: the frames go through a temporary replay file rather than memory
+            handle, record_path = tempfile.mkstemp(suffix=".rpl")
+            os.close(handle)
+        writer = ReplayWriter(record_path, board, args.keyframe_every)
+    if args.analytics:
+        from analytics import TripAnalytics
+        analytics = TripAnalytics(board)
+    if args.terminal:
+        from terminal import TerminalRenderer
+        import atexit
+        view = TerminalRenderer(board, args.terminal, args.every)
+        atexit.register(view.close)  # gives the cursor back even if the run is interrupted
+    if args.workers:
+        from decomposition import StripDecomposition
+        decomposition = StripDecomposition(board, args.workers)
+    stop = None
+    if args.early_stop:
+        from stopping import SteadyStateCriterion
+        stop = SteadyStateCriterion(window = args.stop_window, tolerance = args.stop_tolerance)
+    report = None
+    # the simulation runs in pieces of --checkpoint-every timesteps, saving after each
+    while board.t < args.timesteps:
+        steps = args.timesteps - board.t
+        if args.checkpoint:
+            steps = min(steps, args.checkpoint_every)
+        if args.workers:
+            decomposition.simulate(steps)
+        else:
+            report = board.simulate(steps, args.visualize, args.every, stop = stop)
+        if args.checkpoint:
+            board.save_checkpoint(args.checkpoint)
+        if report is not None and report.stopped:
+            break
+    if args.terminal:
+        view.close()
+    if report is not None and report.stopped:
+        print(f"Stopped at timestep {report.t}: {report.reason}")
+    if args.record or args.export:
+        writer.close()
+    if args.analytics:
+        if args.analytics.endswith(".npz"):
+            analytics.save(args.analytics)
+        else:
+            analytics.to_csv(args.analytics)
+        print("\n".join(f"{name}: {value:.4g}" for name, value in analytics.summary().items()))
+    if args.profile:
+        print(board.profiler.summary())
+    if args.export:
+        from replay import ReplayFrames
+        export_video(ReplayFrames(record_path, step = args.snapshot_every), args.export, processes = args.processes)
+        if not args.record:
+            os.remove(record_path)
 
     # post-simulation visualizations
     board.visualization()
@@ -0,0 +1,45 @@
+class Parameters:
+    """
+    The hand-tuned parameters of the model, gathered so they can be passed to a Board and searched over.
+
+    deposit: pheromone an ant leaves on the tile it leaves (Ant.leave_pheromone)
+    decay_rate: factor every pheromone level is multiplied by each timestep
+    pheromone_floor: level pheromone never decays below, above 0
+    exploit_probability: chance an ant heads for the strongest pheromone rather than a random
+        tile (Ant.decide_turning)
+    activated_per_timestep: number of ants released from the colony each timestep
+    diffusion_rate: share of the way each tile's pheromone moves towards the mean of its
+        neighbors each timestep, 0 (the default) for none (see diffusion.py)
+    diffusion_radius: how far, in tiles, the neighbors pheromone diffuses between reach
+    """
+    names = ("deposit", "decay_rate", "pheromone_floor", "exploit_probability", "activated_per_timestep", "diffusion_rate", "diffusion_radius")
+
+    def __init__(self, deposit = 4, decay_rate = 0.99, pheromone_floor = 0.1, exploit_probability = 0.95, activated_per_timestep = 2, diffusion_rate = 0.0, diffusion_radius = 1):
+        if pheromone_floor <= 0:
+            # ants only explore tiles with pheromone, so every tile needs some
+            raise ValueError(f"The pheromone floor must be above 0, not {pheromone_floor}.")
+        self.deposit = deposit
+        self.decay_rate = decay_rate
+        self.pheromone_floor = pheromone_floor
+        self.exploit_probability = exploit_probability
+        self.activated_per_timestep = activated_per_timestep
+        self.diffusion_rate = diffusion_rate
+        self.diffusion_radius = diffusion_radius
+
+    def replace(self, **changes):
+        """Returns a copy of these parameters with some of them changed."""
+        values = self.as_dict()
+        for name in changes:
+            if name not in values:
+                raise ValueError(f"Unknown parameter {name!r}, expected one of {self.names}.")
+        values.update(changes)
+        return Parameters(**values)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.names}
+
+    def __eq__(self, other):
+        return isinstance(other, Parameters) and self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        return "Parameters(" + ", ".join(f"{name}={value!r}" for name, value in self.as_dict().items()) + ")"
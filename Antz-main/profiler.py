@@ -0,0 +1,64 @@
+import time
+
+class Profiler:
+    """
+    Wall time per phase of Board.update and counters of what the ants do, collected while it is
+    set as a board's profiler (board.profiler = Profiler()). A board without a profiler only
+    pays for an 'is None' check at each hook.
+
+    Counters:
+    moves: calls to Ant.move (ants which neither picked up nor dropped food)
+    blocked_moves: moves where all three tiles in front were blocked, so the ant only turned
+    neighbor_lookups: calls to Board.get_neighboring_tiles (the batched engine counts one per moving ant)
+    deposits: pheromone left by Ant.march
+    turn_arounds: ants turning around after picking up or dropping food
+    exploit, explore: decide_turning following the strongest pheromone, or any pheromone
+    """
+    PHASES = ("activation", "ants", "tiles")
+    COUNTERS = ("moves", "blocked_moves", "neighbor_lookups", "deposits", "turn_arounds", "exploit", "explore")
+
+    def __init__(self):
+        self.steps = 0
+        self.times = dict.fromkeys(self.PHASES, 0.0)
+        self.counts = dict.fromkeys(self.COUNTERS, 0)
+
+    def count(self, name, amount = 1):
+        self.counts[name] += amount
+
+    def profile_update(self, board):
+        """Board.update with each of its phases timed."""
+        start = time.perf_counter()
+        board.update_activation()
+        activated = time.perf_counter()
+        board.update_ant_phase()
+        moved = time.perf_counter()
+        board.update_tiles()
+        end = time.perf_counter()
+        self.times["activation"] += activated - start
+        self.times["ants"] += moved - activated
+        self.times["tiles"] += end - moved
+        self.steps += 1
+
+    def as_dict(self):
+        return {"steps": self.steps, "times": dict(self.times), "counts": dict(self.counts)}
+
+    def summary(self):
+        """The times and counters as a table, with their share of the total and per-timestep values."""
+        steps = max(self.steps, 1)
+        total = sum(self.times.values()) or 1.0
+        lines = [f"{self.steps} timesteps profiled", "",
+                 f"{'phase':<18}{'seconds':>12}{'ms/step':>12}{'share':>9}"]
+        for name in self.PHASES:
+            seconds = self.times[name]
+            lines.append(f"{name:<18}{seconds:>12.3f}{seconds / steps * 1e3:>12.4f}{seconds / total:>9.1%}")
+        lines += ["", f"{'counter':<18}{'total':>12}{'per step':>12}{'share':>9}"]
+        shares = {
+            "blocked_moves": self.counts["moves"],
+            "exploit": self.counts["exploit"] + self.counts["explore"],
+            "explore": self.counts["exploit"] + self.counts["explore"],
+        }
+        for name in self.COUNTERS:
+            value = self.counts[name]
+            share = f"{value / shares[name]:>9.1%}" if shares.get(name) else ""
+            lines.append(f"{name:<18}{value:>12}{value / steps:>12.2f}{share}")
+        return "\n".join(lines)
@@ -0,0 +1,180 @@
+import numpy as np
+import os
+
+class ChunkedArray:
+    """
+    An append-only table of integer rows kept in fixed-size chunks, so appending never copies
+    what is already stored.
+
+    With spill_path, every full chunk is appended to that raw binary file (rows of 'columns'
+    values of 'dtype') and dropped from memory, so only the chunk being filled stays in RAM.
+    The file is overwritten when the first chunk is spilled, not before.
+    """
+    def __init__(self, columns, dtype = np.int32, chunk_rows = 65536, spill_path = None):
+        self.columns = columns
+        self.dtype = np.dtype(dtype)
+        self.chunk_rows = chunk_rows
+        self.spill_path = spill_path
+        self.chunks = []
+        self.spilled_rows = 0
+        self.current = np.empty((chunk_rows, columns), dtype=self.dtype)
+        self.filled = 0
+
+    def __len__(self):
+        return self.spilled_rows + len(self.chunks) * self.chunk_rows + self.filled
+
+    def append(self, rows):
+        """Appends an (n, columns) array of rows."""
+        rows = np.asarray(rows, dtype=self.dtype).reshape(-1, self.columns)
+        while len(rows):
+            n = min(len(rows), self.chunk_rows - self.filled)
+            self.current[self.filled:self.filled + n] = rows[:n]
+            self.filled += n
+            rows = rows[n:]
+            if self.filled == self.chunk_rows:
+                self.flush_chunk()
+
+    def flush_chunk(self):
+        """Moves the full current chunk to the list of chunks or to the spill file."""
+        if self.spill_path is None:
+            self.chunks.append(self.current)
+        else:
+            # the first chunk replaces whatever the file held, so that it is only touched once there is something to spill
+            with open(self.spill_path, "ab" if self.spilled_rows else "wb") as spill:
+                self.current.tofile(spill)
+            self.spilled_rows += self.chunk_rows
+        self.current = np.empty((self.chunk_rows, self.columns), dtype=self.dtype)
+        self.filled = 0
+
+    def spilled(self):
+        """The rows in the spill file, memory-mapped (empty without a spill file)."""
+        if not self.spilled_rows:
+            return np.empty((0, self.columns), dtype=self.dtype)
+        return np.memmap(self.spill_path, dtype=self.dtype, mode="r", shape=(self.spilled_rows, self.columns))
+
+    def tail(self):
+        """The rows not in the spill file (all of them without one), as one array."""
+        return np.concatenate(self.chunks + [self.current[:self.filled]])
+
+    def restore(self, rows, spill_source = None, spilled_rows = 0):
+        """
+        Replaces the contents with the first 'spilled_rows' rows of the spill file 'spill_source'
+        followed by 'rows'. When that is this array's own spill file it is cut back to those rows
+        and kept; otherwise they are read a chunk at a time, and spilled again if this array spills.
+        """
+        self.chunks = []
+        self.spilled_rows = 0
+        self.filled = 0
+        if spill_source is not None and spilled_rows:
+            row_bytes = self.columns * self.dtype.itemsize
+            if self.spill_path is not None and os.path.exists(self.spill_path) and os.path.samefile(spill_source, self.spill_path):
+                os.truncate(self.spill_path, spilled_rows * row_bytes)
+                self.spilled_rows = spilled_rows
+            else:
+                source = np.memmap(spill_source, dtype=self.dtype, mode="r", shape=(spilled_rows, self.columns))
+                for start in range(0, spilled_rows, self.chunk_rows):
+                    self.append(source[start:start + self.chunk_rows])
+                del source
+        self.append(rows)
+
+    def to_array(self):
+        """All the rows as one (len(self), columns) array."""
+        return np.concatenate([self.spilled()] + self.chunks + [self.current[:self.filled]])
+
+    def column_sum(self):
+        """The sum of every column, one chunk at a time."""
+        total = self.current[:self.filled].sum(axis=0, dtype=np.int64)
+        for chunk in [self.spilled()] + self.chunks:
+            total += chunk.sum(axis=0, dtype=np.int64)
+        return total
+
+class EventRecorder:
+    """
+    Records the food collected and deposited by the ants of a board.
+
+    'counts' holds one row per timestep (row t is timestep t, row 0 is before the first update)
+    with the number of food collected and deposited. 'events' holds one (t, kind, y, x) row per
+    event, kind being COLLECTED or DEPOSITED. Both are ChunkedArrays; with spill_dir they are
+    written to counts.bin and events.bin in that directory as chunks fill up, so memory use stays
+    flat however long the simulation runs.
+
+    'latest' holds the (collected, deposited) counts of the last timestep recorded.
+    """
+    COLLECTED = 0
+    DEPOSITED = 1
+
+    def __init__(self, spill_dir = None, chunk_rows = 65536):
+        self.spill_dir = spill_dir
+        counts_path = events_path = None
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+            counts_path = os.path.join(spill_dir, "counts.bin")
+            events_path = os.path.join(spill_dir, "events.bin")
+        self.counts = ChunkedArray(2, np.int32, chunk_rows, counts_path)
+        self.events = ChunkedArray(4, np.int32, chunk_rows, events_path)
+        self.counts.append(np.zeros((1, 2)))
+        self.latest = (0, 0)
+
+    def record(self, t, collected, deposited):
+        """
+        Records timestep t, where 'collected' and 'deposited' are the (ys, xs) locations of the
+        food picked up and dropped at the colony during it.
+        """
+        self.latest = (len(collected[0]), len(deposited[0]))
+        self.counts.append([self.latest])
+        for kind, (ys, xs) in ((self.COLLECTED, collected), (self.DEPOSITED, deposited)):
+            if len(ys):
+                rows = np.empty((len(ys), 4), dtype=np.int32)
+                rows[:, 0] = t
+                rows[:, 1] = kind
+                rows[:, 2] = ys
+                rows[:, 3] = xs
+                self.events.append(rows)
+
+    def per_timestep(self, kind):
+        """The number of food of 'kind' (COLLECTED or DEPOSITED) at each timestep."""
+        return self.counts.to_array()[:, kind]
+
+    def total(self, kind):
+        """The total number of food of 'kind' so far."""
+        return int(self.counts.column_sum()[kind])
+
+    def histogram(self, kind, bins = 20):
+        """
+        Histogram of the timesteps of the food of 'kind', over the range from its first to its
+        last event (like plt.hist of the event timestamps). Returns (counts, bin edges).
+        """
+        per_timestep = self.per_timestep(kind)
+        times = np.flatnonzero(per_timestep)
+        if len(times) == 0:
+            return np.histogram([], bins=bins)
+        return np.histogram(times, bins=bins, range=(times[0], times[-1]), weights=per_timestep[times])
+
+    def state(self):
+        """
+        What the recorder holds, for Board.save_checkpoint: a dict of settings naming the spill
+        file and the number of rows spilled to it of counts and of events, and a dict of arrays
+        with only the rows not spilled, so a checkpoint does not read spilled data back.
+        """
+        settings = {}
+        for name, table in (("counts", self.counts), ("events", self.events)):
+            spill_path = os.path.abspath(table.spill_path) if table.spilled_rows else None
+            settings[name] = {"spill_path": spill_path, "spilled_rows": table.spilled_rows}
+        return settings, {"counts": self.counts.tail(), "events": self.events.tail()}
+
+    def restore(self, counts, events, spilled = None):
+        """
+        Replaces everything recorded with 'counts' and 'events' (as given by their to_array, or
+        by state(), with its settings as 'spilled': the spill files are append-only, so their
+        first rows are still those recorded when the state was taken).
+        """
+        spilled = spilled or {}
+        for table, rows, name in ((self.counts, counts, "counts"), (self.events, events, "events")):
+            spill = spilled.get(name) or {"spill_path": None, "spilled_rows": 0}
+            table.restore(rows, spill["spill_path"], spill["spilled_rows"])
+
+    def event_list(self, kind):
+        """The events of 'kind' as the [t, (y, x)] lists the board used to keep."""
+        events = self.events.to_array()
+        events = events[events[:, 1] == kind]
+        return [[int(t), (int(y), int(x))] for t, k, y, x in events]
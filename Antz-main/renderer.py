@@ -0,0 +1,252 @@
+import numpy as np
+import os
+import matplotlib.pyplot as plt
+from matplotlib.offsetbox import OffsetImage, AnnotationBbox
+import matplotlib.colors as mcolors
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+SPRITE_SHRINK = 4
+_sprites = None
+
+def shrink(image, factor):
+    """Averages blocks of factor x factor pixels, so the sprite is not resampled from full size every draw."""
+    height = image.shape[0] // factor * factor
+    width = image.shape[1] // factor * factor
+    image = image[:height, :width]
+    return image.reshape(height // factor, factor, width // factor, factor, -1).mean(axis=(1, 3))
+
+def load_sprites():
+    """
+    Reads the images once per process, shrunk by SPRITE_SHRINK, and returns (ant images by
+    direction, bread, anthill).
+
+    https://www.dreamstime.com/stock-illustration-flat-design-single-bread-slice-icon-vector-illustration-image79060025
+    """
+    global _sprites
+    if _sprites is None:
+        ants = [shrink(plt.imread(os.path.join(IMAGE_DIR, f"ant{i}.png")), SPRITE_SHRINK) for i in range(8)]
+        bread = shrink(plt.imread(os.path.join(IMAGE_DIR, "Bread.png")), SPRITE_SHRINK)
+        anthill = shrink(plt.imread(os.path.join(IMAGE_DIR, "anthill.png")), SPRITE_SHRINK)
+        _sprites = (ants, bread, anthill)
+    return _sprites
+
+class Frame:
+    """
+    What is drawn of a board at timestep t: its two pheromone grids, the position, direction
+    and carried food of every ant, the food locations and the colony. Built by Board.get_frame.
+
+    colonies lists every colony when there are several (by default just 'colony'), and blocked
+    is the mask of obstacles, or None when there are none.
+    """
+    __slots__ = ("t", "food_pheromone", "home_pheromone", "ant_y", "ant_x", "ant_direction", "ant_has_food", "food_locs", "colony", "colonies", "blocked")
+
+    def __init__(self, t, food_pheromone, home_pheromone, ant_y, ant_x, ant_direction, ant_has_food, food_locs, colony, colonies = None, blocked = None):
+        self.t = t
+        self.food_pheromone = food_pheromone
+        self.home_pheromone = home_pheromone
+        self.ant_y = ant_y
+        self.ant_x = ant_x
+        self.ant_direction = ant_direction
+        self.ant_has_food = ant_has_food
+        self.food_locs = food_locs
+        self.colony = colony
+        self.colonies = colonies if colonies is not None else [colony]
+        self.blocked = blocked
+
+class BoardRenderer:
+    """
+    Draws frames of a board into one persistent figure: the food pheromone (red) above the home
+    pheromone (blue), with the obstacles (grey), the ants, the food they carry, the food
+    sources and the anthills on both.
+
+    The sprites are read once and the figure, heatmaps and sprite artists are made once; each
+    frame only replaces the heatmap data and moves, shows or hides the existing artists. When
+    the canvas supports it, a frame is blitted: only the heatmaps and sprites are redrawn on top
+    of a saved background. The color scale only changes (with a full redraw) when the pheromone
+    leaves it, so most frames are blitted.
+
+    With every=k, show only draws every k-th frame it is given. blit=False draws every frame in
+    full, which is what saving frames to files needs. clim=(food, home) fixes the top of the two
+    color scales instead, so that frames drawn by different renderers (see export.py) match.
+    """
+    zoom = 0.12 * SPRITE_SHRINK  # Zoom dictates how big the images should appear on the screen
+                                 # All images are 200 x 200 before being shrunk
+
+    def __init__(self, width, height, every = 1, interval = 0.001, blit = True, clim = None):
+        self.width = width
+        self.height = height
+        self.every = every
+        self.interval = interval
+        self.shown = False
+        self.frames_seen = 0
+        self.background = None
+        self.ant_imgs, self.bread_img, self.anthill_img = load_sprites()
+
+        self.fig, self.axes = plt.subplots(2, 1, figsize=(8, 8))
+        self.blit = blit and self.fig.canvas.supports_blit
+        cmaps = [mcolors.LinearSegmentedColormap.from_list("red_map", ["white", "red"]),
+                 mcolors.LinearSegmentedColormap.from_list("blue_map", ["white", "blue"])]
+        self.clim = clim
+        self.images = []
+        for ax, cmap, title, vmax in zip(self.axes, cmaps, ("Food Pheromone", "Home Pheromone"), clim or (1, 1)):
+            image = ax.imshow(np.zeros((height, width)), cmap=cmap, vmin=0, vmax=vmax, extent=(0, width, height, 0),
+                              aspect="auto", interpolation="nearest", animated=self.blit)
+            self.fig.colorbar(image, ax=ax)
+            ax.set_title(title)
+            self.images.append(image)
+        # the obstacles, over the heatmaps: grey where blocked, transparent elsewhere
+        self.obstacles = [ax.imshow(np.zeros((height, width, 4)), extent=(0, width, height, 0), aspect="auto",
+                                    interpolation="nearest", animated=self.blit) for ax in self.axes]
+        self.blocked = None
+
+        # one artist per ant, per carried food and per food source on each axes, reused every frame
+        self.ant_artists = [[] for ax in self.axes]
+        self.ant_sprites = [[] for ax in self.axes]  # the direction each ant artist currently shows
+        self.carried_artists = [[] for ax in self.axes]
+        self.food_artists = [[] for ax in self.axes]
+        self.anthill_artists = [[] for ax in self.axes]
+        self.fig.canvas.mpl_connect("resize_event", self.on_resize)
+
+    def new_artist(self, ax, image, zoom):
+        artist = AnnotationBbox(OffsetImage(image, zoom=zoom), (0, 0), frameon=False, annotation_clip=False, animated=self.blit)
+        artist.set_visible(False)
+        ax.add_artist(artist)
+        return artist
+
+    def pool(self, artists, ax, count, image, zoom):
+        """Grows the list of artists on 'ax' to at least 'count' and returns it."""
+        while len(artists) < count:
+            artists.append(self.new_artist(ax, image, zoom))
+        return artists
+
+    @staticmethod
+    def place(artist, x, y):
+        artist.xy = (x, y)
+        artist.xybox = (x, y)
+        artist.set_visible(True)
+
+    def scale(self, image, grid):
+        """
+        Keeps the color scale of 'image' covering 'grid', with some headroom. Returns True if
+        it had to change, which calls for a full redraw (the colorbar changes with it). A fixed
+        clim never changes.
+        """
+        if self.clim is not None:
+            return False
+        vmin, vmax = image.get_clim()
+        peak = float(grid.max()) if grid.size else 0.0
+        if peak <= vmax and peak >= vmax / 4:
+            return False
+        image.set_clim(0, max(peak * 1.5, 1e-9))
+        return True
+
+    def update(self, frame):
+        """Moves the figure's contents to 'frame'. Returns True if the color scales changed."""
+        rescaled = False
+        for image, grid in zip(self.images, (frame.food_pheromone, frame.home_pheromone)):
+            image.set_data(grid)
+            rescaled |= self.scale(image, grid)
+        if frame.blocked is not self.blocked:
+            self.blocked = frame.blocked
+            overlay = np.zeros((self.height, self.width, 4))
+            if frame.blocked is not None:
+                overlay[frame.blocked] = (0.4, 0.4, 0.4, 1.0)
+            for obstacles in self.obstacles:
+                obstacles.set_data(overlay)
+
+        # plotting the ants at the correct tile with possible food in hand
+        x = frame.ant_x + 0.5
+        y = frame.ant_y + 0.5
+        for a, ax in enumerate(self.axes):
+            ant_artists = self.pool(self.ant_artists[a], ax, len(x), self.ant_imgs[0], self.zoom)
+            carried = self.pool(self.carried_artists[a], ax, len(x), self.bread_img, self.zoom / 2)
+            sprites = self.ant_sprites[a]
+            sprites.extend([0] * (len(ant_artists) - len(sprites)))
+            for i in range(len(x)):
+                if sprites[i] != frame.ant_direction[i]:
+                    sprites[i] = frame.ant_direction[i]
+                    ant_artists[i].offsetbox.set_data(self.ant_imgs[sprites[i]])
+                self.place(ant_artists[i], x[i], y[i])
+                if frame.ant_has_food[i]:
+                    self.place(carried[i], x[i] + 0.2, y[i] - 0.2)
+                else:
+                    carried[i].set_visible(False)
+            for artist in ant_artists[len(x):] + carried[len(x):]:
+                artist.set_visible(False)
+
+            # plotting the food
+            food_artists = self.pool(self.food_artists[a], ax, len(frame.food_locs), self.bread_img, self.zoom)
+            for artist, food in zip(food_artists, frame.food_locs):
+                self.place(artist, food[1] + 0.5, food[0] + 0.5)
+            for artist in food_artists[len(frame.food_locs):]:
+                artist.set_visible(False)
+
+            # plotting the anthills
+            anthills = self.pool(self.anthill_artists[a], ax, len(frame.colonies), self.anthill_img, self.zoom)
+            for artist, colony in zip(anthills, frame.colonies):
+                self.place(artist, colony[1] + 0.5, colony[0] + 0.5)
+            for artist in anthills[len(frame.colonies):]:
+                artist.set_visible(False)
+        return rescaled
+
+    def animated_artists(self, a):
+        artists = [self.images[a], self.obstacles[a]] + self.ant_artists[a] + self.carried_artists[a] + self.food_artists[a] + self.anthill_artists[a]
+        return [artist for artist in artists if artist.get_visible()]
+
+    def stop_blitting(self):
+        """
+        Draws every artist in full from now on. A normal draw leaves out animated artists, so a
+        figure which is shown or saved as it is (rather than blitted) needs this first.
+        """
+        self.blit = False
+        self.background = None
+        for a in range(len(self.axes)):
+            artists = [self.images[a], self.obstacles[a]] + self.ant_artists[a] + self.carried_artists[a] + self.food_artists[a] + self.anthill_artists[a]
+            for artist in artists:
+                artist.set_animated(False)
+
+    def on_resize(self, event):
+        self.background = None
+
+    def draw_animated(self):
+        for a, ax in enumerate(self.axes):
+            for artist in self.animated_artists(a):
+                ax.draw_artist(artist)
+
+    def draw(self, frame):
+        """Draws 'frame', blitting over the saved background when possible."""
+        canvas = self.fig.canvas
+        rescaled = self.update(frame)
+        if not self.blit:
+            canvas.draw()
+        else:
+            # the animated artists are left out of a full draw, which gives the background
+            if rescaled or self.background is None:
+                canvas.draw()
+                self.background = canvas.copy_from_bbox(self.fig.bbox)
+            canvas.restore_region(self.background)
+            self.draw_animated()
+            canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+    def show(self, frame):
+        """
+        Animation step: draws 'frame' (if it is one of every k frames) in a window that stays
+        open, and gives the window 'interval' seconds to process events.
+        """
+        self.frames_seen += 1
+        if (self.frames_seen - 1) % self.every:
+            return
+        if not self.shown:
+            plt.show(block=False)
+            self.shown = True
+        self.draw(frame)
+        self.fig.canvas.start_event_loop(self.interval)
+
+    def save(self, frame, path, dpi = None):
+        """Draws 'frame' and writes the figure to an image file (needs blit=False)."""
+        self.update(frame)
+        self.fig.savefig(path, dpi=dpi)
+
+    def close(self):
+        plt.close(self.fig)
@@ -0,0 +1,401 @@
+from tile import multiplicative_decay, exponential_decay
+from diffusion import Diffusion
+from renderer import Frame
+import numpy as np
+import argparse, json, os
+
+# A replay file is append-only:
+#   MAGIC, the length of the JSON settings (int64), the settings, padded to 8 bytes
+#   records, each starting with RECORD_HEADER int64s:
+#     (RECORD_MAGIC, kind, t, size in bytes with the header, number of pheromone writes, ants, events, food tiles)
+#     STATIC: has_food, is_colony and blocked, one byte per tile
+#     KEYFRAME: home and food pheromone (every colony's layer), is_occupied and has_food (one byte
+#               per tile), then ant y, x (int32) and state (one byte per ant: direction |
+#               has_food << 3 | activated << 4)
+#     DELTA: the pheromone written during timestep t (tile id int32, layer uint8: 2 * colony + 1
+#            for home pheromone, 2 * colony for food pheromone, value), the
+#            ants which changed (id, y, x int32, state byte), the food picked up (kind 0)
+#            or dropped (kind 1) as (kind, y, x) int32 rows, and the tiles whose food appeared
+#            or ran out (tile id int32, has_food byte)
+#   a footer with the timesteps and offsets of every delta and keyframe (int64 arrays), then
+#   TRAILER int64s: (footer offset, number of deltas, number of keyframes, END_MAGIC)
+# Every section is padded to 8 bytes. A file without its footer (a run which died) is indexed
+# by walking the records instead.
+MAGIC = b"ANTZRPL1"
+RECORD_MAGIC = 0x414E545A52454344
+END_MAGIC = 0x414E545A454E4421
+STATIC, KEYFRAME, DELTA = 0, 1, 2
+HEADER_WORDS = 8
+TRAILER_WORDS = 4
+
+def padded(size):
+    return -(-size // 8) * 8
+
+def pack_state(direction, has_food, activated):
+    return (np.asarray(direction, dtype=np.uint8) | (np.asarray(has_food, dtype=np.uint8) << 3) | (np.asarray(activated, dtype=np.uint8) << 4)).astype(np.uint8)
+
+def unpack_state(state):
+    """Returns (direction, has_food, activated) arrays from packed ant states."""
+    return (state & 7).astype(np.int64), (state & 8).astype(bool), (state & 16).astype(bool)
+
+class ReplayWriter:
+    """
+    Records a board as it is simulated, to a replay file (see the layout above) read with Replay.
+
+    It writes the board's current state as the first keyframe, then, after every timestep of
+    Board.simulate, a delta: the pheromone values written during the timestep (diffusion and
+    decay are not stored, the reader applies them), the ants whose position, direction, food or activation
+    changed, the food picked up and dropped, and the food sources which ran out or respawned.
+    Every keyframe_every timesteps a full keyframe follows the delta.
+
+    Boards stepped by a StripDecomposition are not recorded, as their workers write the
+    pheromone directly.
+    """
+    def __init__(self, path, board, keyframe_every = 1000):
+        self.path = path
+        self.board = board
+        self.keyframe_every = keyframe_every
+        self.file = open(path, "wb")
+        self.deltas = ([], [])
+        self.keyframes = ([], [])
+
+        field = board.grid
+        self.dtype = field.food_pheromone.dtype
+        settings = {
+            "width": board.width, "height": board.height, "num_ants": board.num_ants, "colony": [int(c) for c in board.colony],
+            "colonies": [[int(y), int(x)] for y, x in board.colonies],
+            "dtype": self.dtype.name, "decay_model": field.decay_model, "decay_rate": field.decay_rate,
+            "pheromone_floor": field.pheromone_floor, "inital_pheromone": field.inital_pheromone,
+            "decay_constants": [field.a_f, field.b_f, field.c_f, field.a_h, field.b_h, field.c_h],
+            "diffusion": [field.diffusion.rate, field.diffusion.radius, field.diffusion.method] if field.diffusion is not None else None,
+            "keyframe_every": keyframe_every, "start": board.t,
+        }
+        text = json.dumps(settings).encode()
+        self.file.write(MAGIC)
+        self.file.write(np.int64(len(text)).tobytes())
+        self.file.write(text + b"\0" * (padded(len(text)) - len(text)))
+        self.write_record(STATIC, board.t, [field.has_food.astype(np.uint8), field.is_colony.astype(np.uint8), field.blocked.astype(np.uint8)])
+        self.write_keyframe()
+
+        self.previous = self.ant_arrays()
+        self.food = field.has_food.copy()
+        self.food_version = board.food.version
+        field.journal = []
+        board.observers.append(self)
+
+    def ant_arrays(self):
+        state = self.board.ant_state
+        return state.y.astype(np.int32), state.x.astype(np.int32), pack_state(state.direction, state.has_food, state.activated)
+
+    def write_record(self, kind, t, arrays, counts = (0, 0, 0, 0)):
+        offset = self.file.tell()
+        size = HEADER_WORDS * 8 + sum(padded(array.nbytes) for array in arrays)
+        self.file.write(np.array([RECORD_MAGIC, kind, t, size, *counts], dtype=np.int64).tobytes())
+        for array in arrays:
+            data = np.ascontiguousarray(array).tobytes()
+            self.file.write(data + b"\0" * (padded(len(data)) - len(data)))
+        return offset
+
+    def write_keyframe(self):
+        board = self.board
+        field = board.grid
+        field.synchronize()
+        y, x, state = self.ant_arrays()
+        offset = self.write_record(KEYFRAME, board.t, [field.home_layers, field.food_layers,
+                                                        field.is_occupied.astype(np.uint8), field.has_food.astype(np.uint8), y, x, state])
+        self.keyframes[0].append(board.t)
+        self.keyframes[1].append(offset)
+
+    def on_update(self, board):
+        """Called by Board.simulate after each timestep."""
+        field = board.grid
+        journal = field.journal
+        field.journal = []
+        cells = np.empty(len(journal), dtype=np.int32)
+        layers = np.empty(len(journal), dtype=np.uint8)
+        values = np.empty(len(journal), dtype=self.dtype)
+        if journal and all(np.ndim(index[0]) == 0 for code, index, value, colony in journal):
+            # the reference engine writes one tile at a time
+            cells[:] = [index[0] * board.width + index[1] for code, index, value, colony in journal]
+            layers[:] = [2 * colony + (code == 1) for code, index, value, colony in journal]
+            values[:] = [value for code, index, value, colony in journal]
+        elif journal:
+            cells = np.concatenate([np.ravel_multi_index(index, field.shape).ravel() for code, index, value, colony in journal]).astype(np.int32)
+            layers = np.concatenate([np.broadcast_to(2 * np.asarray(colony, dtype=np.uint8) + (code == 1), np.shape(index[0])).ravel()
+                                     for code, index, value, colony in journal]).astype(np.uint8)
+            values = np.concatenate([np.broadcast_to(np.asarray(value, dtype=self.dtype), np.shape(index[0])).ravel() for code, index, value, colony in journal])
+
+        y, x, state = self.ant_arrays()
+        old_y, old_x, old_state = self.previous
+        changed = np.flatnonzero((y != old_y) | (x != old_x) | (state != old_state))
+        had_food = (old_state[changed] & 8) != 0
+        has_food = (state[changed] & 8) != 0
+        events = []
+        for kind, mask in ((0, ~had_food & has_food), (1, had_food & ~has_food)):
+            ants = changed[mask]
+            events.append(np.stack([np.full(len(ants), kind, dtype=np.int32), y[ants], x[ants]], axis=1))
+        events = np.concatenate(events)
+        self.previous = (y, x, state)
+
+        # the food tiles are only compared when the registry says a source ran out or respawned
+        food_cells = np.zeros(0, dtype=np.int32)
+        if board.food.version != self.food_version:
+            self.food_version = board.food.version
+            food_cells = np.flatnonzero(field.has_food != self.food).astype(np.int32)
+            self.food = field.has_food.copy()
+        food_values = self.food.reshape(-1)[food_cells].astype(np.uint8)
+
+        offset = self.write_record(DELTA, board.t, [cells, layers, values, changed.astype(np.int32), y[changed], x[changed], state[changed], events,
+                                                    food_cells, food_values], (len(cells), len(changed), len(events), len(food_cells)))
+        self.deltas[0].append(board.t)
+        self.deltas[1].append(offset)
+        if board.t % self.keyframe_every == 0:
+            self.write_keyframe()
+
+    def close(self):
+        """Writes the footer and closes the file. The board stops being recorded."""
+        if self.file.closed:
+            return
+        if self in self.board.observers:
+            self.board.observers.remove(self)
+        self.board.grid.journal = None
+        footer = self.file.tell()
+        for values in self.deltas + self.keyframes:
+            self.file.write(np.array(values, dtype=np.int64).tobytes())
+        self.file.write(np.array([footer, len(self.deltas[0]), len(self.keyframes[0]), END_MAGIC], dtype=np.int64).tobytes())
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class Replay:
+    """
+    Reads a replay file written by ReplayWriter. The file is memory-mapped, so only the
+    records needed are read from disk, however big it is.
+
+    frame(t) returns the board at timestep t as a Frame, which BoardRenderer and export.py
+    draw. It starts from the last keyframe at or before t (or from the last timestep read,
+    if that is closer) and applies the deltas up to t, diffusing and decaying the pheromone
+    as the board did. frames(start, stop, step) reads a range of timesteps in order.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.data = np.memmap(path, dtype=np.uint8, mode="r")
+        if bytes(self.data[:8]) != MAGIC:
+            raise ValueError(f"{path} is not a replay file.")
+        length = int(self.data[8:16].view(np.int64)[0])
+        self.settings = json.loads(bytes(self.data[16:16 + length]).decode())
+        self.first_record = 16 + padded(length)
+        s = self.settings
+        self.width = s["width"]
+        self.height = s["height"]
+        self.num_ants = s["num_ants"]
+        self.colony = tuple(s["colony"])
+        self.colonies = [tuple(colony) for colony in s["colonies"]]
+        self.dtype = np.dtype(s["dtype"])
+        self.index()
+
+        kind, t, arrays = self.record(self.first_record)
+        self.has_food = arrays[0].astype(bool).reshape(self.height, self.width)
+        self.is_colony = arrays[1].astype(bool).reshape(self.height, self.width)
+        self.blocked = arrays[2].astype(bool).reshape(self.height, self.width)
+        self.scratch = None
+        self.diffusion = Diffusion(*s["diffusion"]) if s["diffusion"] is not None else None
+        self.state = None
+
+    @property
+    def start(self):
+        return self.keyframe_steps[0]
+
+    @property
+    def end(self):
+        return self.delta_steps[-1] if len(self.delta_steps) else self.start
+
+    def index(self):
+        """Reads the footer, or walks the records of a file which has none."""
+        trailer = self.data[-TRAILER_WORDS * 8:].view(np.int64) if len(self.data) >= self.first_record + TRAILER_WORDS * 8 else None
+        if trailer is not None and trailer[3] == END_MAGIC:
+            footer, deltas, keyframes = (int(value) for value in trailer[:3])
+            words = self.data[footer:footer + (2 * deltas + 2 * keyframes) * 8].view(np.int64)
+            self.delta_steps, self.delta_offsets = words[:deltas], words[deltas:2 * deltas]
+            self.keyframe_steps, self.keyframe_offsets = words[2 * deltas:2 * deltas + keyframes], words[2 * deltas + keyframes:]
+            return
+        found = {DELTA: ([], []), KEYFRAME: ([], [])}
+        offset = self.first_record
+        while offset + HEADER_WORDS * 8 <= len(self.data):
+            header = self.data[offset:offset + HEADER_WORDS * 8].view(np.int64)
+            if header[0] != RECORD_MAGIC or offset + header[3] > len(self.data):
+                break  # the end of what was written
+            if header[1] in found:
+                found[header[1]][0].append(int(header[2]))
+                found[header[1]][1].append(offset)
+            offset += int(header[3])
+        self.delta_steps, self.delta_offsets = (np.array(values, dtype=np.int64) for values in found[DELTA])
+        self.keyframe_steps, self.keyframe_offsets = (np.array(values, dtype=np.int64) for values in found[KEYFRAME])
+
+    def record(self, offset):
+        """Returns (kind, t, arrays) for the record at 'offset', the arrays being views of the file."""
+        header = self.data[offset:offset + HEADER_WORDS * 8].view(np.int64)
+        kind, t = int(header[1]), int(header[2])
+        cells = self.width * self.height
+        if kind == STATIC:
+            layout = [(np.uint8, cells)] * 3
+        elif kind == KEYFRAME:
+            layers = len(self.colonies) * cells
+            layout = [(self.dtype, layers), (self.dtype, layers), (np.uint8, cells), (np.uint8, cells), (np.int32, self.num_ants), (np.int32, self.num_ants), (np.uint8, self.num_ants)]
+        else:
+            writes, ants, events, food = (int(value) for value in header[4:8])
+            layout = [(np.int32, writes), (np.uint8, writes), (self.dtype, writes), (np.int32, ants), (np.int32, ants), (np.int32, ants), (np.uint8, ants), (np.int32, 3 * events),
+                      (np.int32, food), (np.uint8, food)]
+        arrays = []
+        position = offset + HEADER_WORDS * 8
+        for dtype, count in layout:
+            size = np.dtype(dtype).itemsize * count
+            arrays.append(self.data[position:position + size].view(dtype))
+            position += padded(size)
+        return kind, t, arrays
+
+    def load_keyframe(self, i):
+        kind, t, (home, food, occupied, food_tiles, y, x, state) = self.record(int(self.keyframe_offsets[i]))
+        shape = (self.height, self.width)
+        layers = (len(self.colonies),) + shape
+        direction, has_food, activated = unpack_state(state)
+        self.state = {
+            "t": t, "home_pheromone": home.reshape(layers).copy(), "food_pheromone": food.reshape(layers).copy(),
+            "is_occupied": occupied.astype(bool).reshape(shape), "has_food_tile": food_tiles.astype(bool).reshape(shape), "y": y.astype(np.int64), "x": x.astype(np.int64),
+            "direction": direction, "has_food": has_food, "activated": activated,
+        }
+
+    def decay(self, pheromone, constants):
+        s = self.settings
+        if s["decay_model"] == "exponential":
+            if self.scratch is None:
+                self.scratch = np.empty_like(pheromone)
+            exponential_decay(pheromone, *constants, s["inital_pheromone"], self.scratch)
+        else:
+            multiplicative_decay(pheromone, s["decay_rate"], s["pheromone_floor"])
+
+    def apply_delta(self, i):
+        kind, t, (cells, layers, values, ants, y, x, state, events, food_cells, food_values) = self.record(int(self.delta_offsets[i]))
+        s = self.state
+        home = s["home_pheromone"].reshape(len(self.colonies), -1)
+        food = s["food_pheromone"].reshape(len(self.colonies), -1)
+        # the writes in the order they were made, so a tile written twice keeps the last value
+        for layer in np.unique(layers).tolist():
+            mine = layers == layer
+            pheromone = home if layer % 2 else food
+            pheromone[layer // 2, cells[mine]] = values[mine]
+        if self.diffusion is not None:
+            self.diffusion(s["food_pheromone"], self.blocked)
+            self.diffusion(s["home_pheromone"], self.blocked)
+        constants = self.settings["decay_constants"]
+        self.decay(s["food_pheromone"], constants[:3])
+        self.decay(s["home_pheromone"], constants[3:])
+
+        occupied = s["is_occupied"]
+        old_y = s["y"][ants]
+        old_x = s["x"][ants]
+        occupied[old_y, old_x] = False
+        occupied[y, x] = True
+        occupied[self.is_colony] = False
+        s["y"][ants] = y
+        s["x"][ants] = x
+        s["direction"][ants], s["has_food"][ants], s["activated"][ants] = unpack_state(state)
+        s["has_food_tile"].reshape(-1)[food_cells] = food_values.astype(bool)
+        s["t"] = t
+
+    def seek(self, t):
+        """Brings the reader's state to timestep t."""
+        if not self.start <= t <= self.end:
+            raise IndexError(f"Timestep {t} is not in the replay ({self.start} to {self.end}).")
+        key = int(np.searchsorted(self.keyframe_steps, t, side="right")) - 1
+        if self.state is None or not self.keyframe_steps[key] <= self.state["t"] <= t:
+            self.load_keyframe(key)
+        first = int(np.searchsorted(self.delta_steps, self.state["t"], side="right"))
+        last = int(np.searchsorted(self.delta_steps, t, side="right"))
+        for i in range(first, last):
+            self.apply_delta(i)
+
+    def frame(self, t):
+        """The board at timestep t, as a Frame (showing the highest pheromone of any colony, as Board.get_frame does)."""
+        self.seek(t)
+        s = self.state
+        return Frame(t, s["food_pheromone"].max(axis=0), s["home_pheromone"].max(axis=0), s["y"].copy(), s["x"].copy(),
+                     s["direction"].copy(), s["has_food"].copy(), np.argwhere(s["has_food_tile"]), self.colony, self.colonies,
+                     self.blocked if self.blocked.any() else None)
+
+    def frames(self, start = None, stop = None, step = 1):
+        """The Frames of timesteps start, start + step, ... up to stop (included)."""
+        start = self.start if start is None else start
+        stop = self.end if stop is None else stop
+        for t in range(start, stop + 1, step):
+            yield self.frame(t)
+
+    def events(self, t):
+        """The food picked up (kind 0) and dropped (kind 1) during timestep t, as (kind, y, x) rows."""
+        i = int(np.searchsorted(self.delta_steps, t))
+        if i == len(self.delta_steps) or self.delta_steps[i] != t:
+            raise IndexError(f"Timestep {t} is not in the replay.")
+        return self.record(int(self.delta_offsets[i]))[2][7].reshape(-1, 3)
+
+class ReplayFrames:
+    """
+    The Frames of timesteps start, start + step, ... up to stop of a replay file, read one at a
+    time as they are iterated over, so only one frame is in memory however long the run was.
+    Slicing gives another ReplayFrames, and it pickles as just the path and the timesteps, so
+    export.py can hand each worker its share of a long run to read for itself.
+    """
+    def __init__(self, path, start = None, stop = None, step = 1):
+        self.path = path
+        if start is None or stop is None:
+            replay = Replay(path)
+            start = replay.start if start is None else start
+            stop = replay.end if stop is None else stop
+        self.times = range(start, stop + 1, step)
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return Replay(self.path).frame(self.times[key])
+        frames = ReplayFrames.__new__(ReplayFrames)
+        frames.path = self.path
+        frames.times = self.times[key]
+        return frames
+
+    def __iter__(self):
+        if not self.times:
+            return
+        replay = Replay(self.path)
+        for t in self.times:
+            yield replay.frame(t)
+
+if __name__ == "__main__":
+    """
+    Draws part of a recorded run (see main.py --record) to a video, or one timestep to an image.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("replay", help="replay file written with --record")
+    parser.add_argument("output", help="a .gif or .mp4 file for a range of timesteps, or a .png for --at")
+    parser.add_argument("--at", type=int, help="the timestep to draw to a .png", default = None)
+    parser.add_argument("--start", type=int, help="first timestep of the video", default = None)
+    parser.add_argument("--stop", type=int, help="last timestep of the video", default = None)
+    parser.add_argument("--step", type=int, help="timesteps between frames", default = 1)
+    parser.add_argument("-p", "--processes", type=int, help="number of processes drawing the frames (default: all cores)", default = None)
+    args = parser.parse_args()
+
+    # renderer has already imported pyplot, so setting MPLBACKEND here would come too late
+    if "MPLBACKEND" not in os.environ:
+        import matplotlib
+        matplotlib.use("Agg")
+    replay = Replay(args.replay)
+    if args.at is not None:
+        from renderer import BoardRenderer
+        BoardRenderer(replay.width, replay.height, blit=False).save(replay.frame(args.at), args.output)
+    else:
+        from export import export_video
+        export_video(ReplayFrames(args.replay, args.start, args.stop, args.step), args.output, processes = args.processes)
@@ -0,0 +1,139 @@
+from main import Board
+from parameters import Parameters
+from ensemble import replicate_seeds
+from recorder import EventRecorder
+import numpy as np
+import argparse, io, math, multiprocessing
+
+# The default search space: (low, high) samples uniformly, a list picks one of its values
+DEFAULT_SPACE = {
+    "deposit": (1.0, 10.0),
+    "decay_rate": (0.9, 0.999),
+    "pheromone_floor": (0.01, 1.0),
+    "exploit_probability": (0.5, 1.0),
+    "activated_per_timestep": [1, 2, 3, 4, 6, 8],
+}
+
+def sample_configurations(num_configurations, space = DEFAULT_SPACE, seed = None):
+    """Draws num_configurations random Parameters from 'space' (see DEFAULT_SPACE)."""
+    rng = np.random.default_rng(seed)
+    configurations = []
+    for i in range(num_configurations):
+        values = {}
+        for name, domain in space.items():
+            if isinstance(domain, list):
+                values[name] = domain[rng.integers(len(domain))]
+            else:
+                values[name] = float(rng.uniform(domain[0], domain[1]))
+        configurations.append(Parameters().replace(**values))
+    return configurations
+
+def advance_trial(task):
+    """
+    Worker function: runs one (configuration, seed) trial up to 'horizon' timesteps.
+
+    'task' is (key, seed, params, checkpoint, horizon, board_kwargs), where 'checkpoint' is None
+    for a new trial or the checkpoint bytes returned by the previous rung, whose board is loaded
+    and extended instead of being simulated again from the start (it carries its own random
+    generator). Boards themselves never cross between processes, only these compressed
+    checkpoints. Returns (key, score, checkpoint) where the score is the food deposited per
+    timestep so far.
+    """
+    key, seed, params, checkpoint, horizon, board_kwargs = task
+    if checkpoint is None:
+        board = Board(params=params, seed=seed, **board_kwargs)
+    else:
+        board = Board.load_checkpoint(io.BytesIO(checkpoint))
+    board.simulate(horizon - board.t)
+    score = board.recorder.total(EventRecorder.DEPOSITED) / board.t
+    saved = io.BytesIO()
+    board.save_checkpoint(saved)
+    return key, score, saved.getvalue()
+
+class SearchResult:
+    """
+    The outcome of a successive halving search. 'history' has one (rung, horizon, configuration
+    index, mean score) entry per configuration evaluated at each rung, and 'best' is the index
+    of the configuration which survived to the end.
+    """
+    def __init__(self, configurations):
+        self.configurations = configurations
+        self.history = []
+        self.best = None
+
+    @property
+    def best_parameters(self):
+        return self.configurations[self.best]
+
+    def scores(self, rung):
+        """The (configuration index, mean score) pairs of a rung, best first."""
+        entries = [(index, score) for r, horizon, index, score in self.history if r == rung]
+        return sorted(entries, key=lambda entry: -entry[1])
+
+    def __str__(self):
+        lines = []
+        for rung in sorted(set(entry[0] for entry in self.history)):
+            horizon = next(entry[1] for entry in self.history if entry[0] == rung)
+            lines.append(f"rung {rung}: {len(self.scores(rung))} configurations for {horizon} timesteps")
+            for index, score in self.scores(rung):
+                lines.append(f"  {score:.5f}  {self.configurations[index]}")
+        return "\n".join(lines)
+
+def successive_halving(configurations, min_time = 1000, max_time = 100000, eta = 3, seeds = 3, seed = None, processes = None, **board_kwargs):
+    """
+    Successive halving over 'configurations' (a list of Parameters).
+
+    Every configuration is run on 'seeds' boards (the same seeds for every configuration) for
+    min_time timesteps and scored by its mean food deposited per timestep. The best 1/eta of
+    them survive and are extended, not restarted, to eta times the horizon, and so on until
+    max_time is reached or a single configuration is left. All trials of a rung are spread
+    across a process pool.
+    """
+    result = SearchResult(configurations)
+    trial_seeds = replicate_seeds(seeds, seed)
+    saved = {}
+    survivors = list(range(len(configurations)))
+    horizon = min(min_time, max_time)
+    rung = 0
+    with multiprocessing.Pool(processes) as pool:
+        while True:
+            tasks = [((index, s), trial_seeds[s], configurations[index], saved.get((index, s)), horizon, board_kwargs)
+                     for index in survivors for s in range(seeds)]
+            totals = {index: 0.0 for index in survivors}
+            for key, score, checkpoint in pool.imap_unordered(advance_trial, tasks):
+                saved[key] = checkpoint
+                totals[key[0]] += score / seeds
+            for index in survivors:
+                result.history.append((rung, horizon, index, totals[index]))
+
+            ranked = sorted(survivors, key=lambda index: -totals[index])
+            if horizon >= max_time or len(survivors) == 1:
+                result.best = ranked[0]
+                return result
+            survivors = ranked[:max(1, math.ceil(len(survivors) / eta))]
+            saved = {key: checkpoint for key, checkpoint in saved.items() if key[0] in survivors}
+            horizon = min(horizon * eta, max_time)
+            rung += 1
+
+if __name__ == "__main__":
+    """
+    Searches for good hyperparameters with successive halving and prints the results of each rung.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--configurations", type=int, help="number of random configurations to start with", default = 27)
+    parser.add_argument("--min-time", type=int, help="timesteps every configuration is run for in the first rung", default = 1000)
+    parser.add_argument("--max-time", type=int, help="timesteps the final survivors are run for", default = 100000)
+    parser.add_argument("--eta", type=int, help="only the best 1/eta configurations survive each rung", default = 3)
+    parser.add_argument("--seeds", type=int, help="boards simulated per configuration", default = 3)
+    parser.add_argument("-s", "--seed", type=int, help="seed for the sampled configurations and the boards", default = None)
+    parser.add_argument("-p", "--processes", type=int, help="number of worker processes (default: all cores)", default = None)
+    parser.add_argument("-a", "--ants", type=int, help="number of ants", default = 6)
+    parser.add_argument("-f", "--food", type=int, help="number of food", default = 3)
+    parser.add_argument("-d", "--dimensions", type=int, help="first argument width of grid, second argument height of grid", nargs = 2, default=[15, 15])
+    args = parser.parse_args()
+
+    configurations = sample_configurations(args.configurations, seed = args.seed)
+    result = successive_halving(configurations, args.min_time, args.max_time, args.eta, args.seeds, args.seed, args.processes,
+                                num_ants = args.ants, num_food = args.food, spawn_radius = 4, width = args.dimensions[0], height = args.dimensions[1])
+    print(result)
+    print(f"best: {result.best_parameters}")
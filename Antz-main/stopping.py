@@ -0,0 +1,95 @@
+from collections import deque
+import math
+
+class StopReport:
+    """
+    What Board.simulate(stop=...) returns: whether the run was stopped early ('stopped'), why
+    ('reason': "converged", "collapsed", or None when it ran its full time), the timestep it
+    ended at ('t'), the timesteps simulated by this call ('steps') and the mean food deposited
+    per window of the last span windows when it ended ('window_mean').
+    """
+    def __init__(self, reason, t, steps, window_mean):
+        self.reason = reason
+        self.t = t
+        self.steps = steps
+        self.window_mean = window_mean
+
+    @property
+    def stopped(self):
+        return self.reason is not None
+
+    def as_dict(self):
+        return {"reason": self.reason, "t": self.t, "steps": self.steps, "window_mean": self.window_mean}
+
+    def __repr__(self):
+        return f"StopReport(reason={self.reason!r}, t={self.t}, steps={self.steps}, window_mean={self.window_mean!r})"
+
+class SteadyStateCriterion:
+    """
+    Decides when a run has stopped changing, from the food deposited per window of 'window'
+    timesteps, kept as a stream: only the last 2 * span window totals are stored.
+
+    converged: the mean of the last 'span' windows is within 'tolerance' (relative) of the
+        mean of the 'span' windows before them, for 'patience' windows in a row
+    collapsed: no food was deposited for 'idle_windows' windows in a row
+
+    Either test is left out by setting tolerance or idle_windows to None. Nothing stops a
+    run before min_time timesteps have been checked, counted from the first check.
+
+    check(deposits) is given the food deposited at each timestep, in order, and returns the
+    reason to stop or None. The criterion keeps its state between simulate calls, so a run
+    split into several calls is judged as one.
+    """
+    def __init__(self, window = 1000, span = 5, tolerance = 0.05, patience = 3, idle_windows = 10, min_time = 0):
+        self.window = window
+        self.span = span
+        self.tolerance = tolerance
+        self.patience = patience
+        self.idle_windows = idle_windows
+        self.min_time = min_time
+        self.reset()
+
+    def reset(self):
+        """Forgets everything seen so far."""
+        self.steps = 0
+        self.current = 0
+        self.totals = deque(maxlen=2 * self.span)
+        self.stable = 0
+        self.idle = 0
+
+    @property
+    def window_mean(self):
+        """The mean food deposited per window over the last 'span' complete windows, or None before there are any."""
+        if not self.totals:
+            return None
+        recent = list(self.totals)[-self.span:]
+        return sum(recent) / len(recent)
+
+    def check(self, deposits):
+        """Adds one timestep with 'deposits' food deposited. Returns "converged", "collapsed" or None."""
+        self.steps += 1
+        self.current += deposits
+        if self.steps % self.window:
+            return None
+        total = self.current
+        self.current = 0
+        self.totals.append(total)
+
+        self.idle = self.idle + 1 if total == 0 else 0
+        if len(self.totals) == 2 * self.span and self.tolerance is not None:
+            totals = list(self.totals)
+            previous = sum(totals[:self.span]) / self.span
+            recent = sum(totals[self.span:]) / self.span
+            close = abs(recent - previous) <= self.tolerance * max(abs(previous), 1e-12)
+            self.stable = self.stable + 1 if close else 0
+
+        if self.steps < self.min_time:
+            return None
+        if self.idle_windows is not None and self.idle >= self.idle_windows:
+            return "collapsed"
+        if self.tolerance is not None and self.stable >= self.patience:
+            return "converged"
+        return None
+
+    def report(self, reason, t, steps):
+        return StopReport(reason, t, steps, self.window_mean)
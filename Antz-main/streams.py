@@ -0,0 +1,43 @@
+import numpy as np
+
+class RandomStream:
+    """
+    Pre-drawn random numbers for the ants of a board.
+
+    Each timestep every ant gets a row of two uniforms in [0, 1): the first decides exploit or
+    explore in decide_turning, the second picks among the candidate tiles (int(u * n) of n) or
+    the side an ant turns to when it is blocked. The rows are drawn from the board's Generator a
+    block of timesteps at a time, so the ant logic never calls into the generator itself and a
+    run is fully determined by the board's seed, whichever engine steps the ants.
+
+    block_state is the generator's state just before the current block was drawn, so the block
+    can be drawn again (see redraw) instead of being stored.
+    """
+    # roughly how many numbers are drawn at once
+    block_numbers = 1 << 16
+
+    def __init__(self, rng, num_ants):
+        self.rng = rng
+        self.num_ants = num_ants
+        self.block_steps = max(1, self.block_numbers // max(2 * num_ants, 1))
+        self.block = np.empty((0, num_ants, 2))
+        self.block_state = None
+        self.position = 0
+
+    def next_step(self):
+        """Returns the (num_ants, 2) uniforms for the next timestep."""
+        if self.position >= len(self.block):
+            self.block_state = self.rng.bit_generator.state
+            self.block = self.rng.random((self.block_steps, self.num_ants, 2))
+            self.position = 0
+        draws = self.block[self.position]
+        self.position += 1
+        return draws
+
+    def redraw(self, block_state, block_steps):
+        """Draws the block of 'block_steps' timesteps drawn from 'block_state' again, leaving the generator where it is."""
+        state = self.rng.bit_generator.state
+        self.rng.bit_generator.state = block_state
+        self.block = self.rng.random((block_steps, self.num_ants, 2))
+        self.block_state = block_state
+        self.rng.bit_generator.state = state
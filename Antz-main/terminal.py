@@ -0,0 +1,139 @@
+from renderer import Frame
+import numpy as np
+import shutil, sys, time
+
+class TerminalRenderer:
+    """
+    Draws frames of a board as text in a terminal, for watching a run live where there is no
+    display (e.g. over SSH). Attach it with TerminalRenderer(board); Board.simulate then calls
+    on_update after every timestep, which draws every 'every'-th timestep, at most 'fps' times
+    a second (0 for no limit). close() draws the last timestep and gives the terminal back.
+
+    Each tile is one character: the pheromone of 'layer' ("food" or "home", the highest of
+    any colony) on the RAMP from the lowest to the highest level on screen, then, on top,
+    '#' for obstacles, the ants as an arrow of their direction (ANT_GLYPHS, in the order of
+    Board.directions), 'C' for colonies and 'F' for food, as in Board.__str__.
+
+    A frame is built into a reused (rows, columns) byte buffer, from the board's arrays without
+    copying them, and only the rows which differ from the frame before are sent, each after an
+    ANSI cursor move. Boards larger than the terminal are cut to its size (or to width and
+    height, if given), from the top left corner. draw(frame) also draws any Frame, such as
+    those of a Replay.
+    """
+    RAMP = np.frombuffer(b" .:-=+*%@", dtype=np.uint8)
+    ANT_GLYPHS = np.frombuffer(b"v\\>/^\\</", dtype=np.uint8)
+    OBSTACLE, COLONY, FOOD = ord("#"), ord("C"), ord("F")
+    LAYERS = ("food", "home")
+
+    def __init__(self, board = None, layer = "food", every = 1, fps = 30, stream = None, width = None, height = None):
+        if layer not in self.LAYERS:
+            raise ValueError(f"Unknown layer {layer!r}, expected one of {self.LAYERS}.")
+        self.layer = layer
+        self.every = every
+        self.fps = fps
+        self.stream = stream if stream is not None else sys.stdout
+        self.width = width
+        self.height = height
+        self.board = board
+        self.last_draw = -float("inf")
+        self.drawn_t = None
+        self.buffer = None
+        self.previous = None
+        self.closed = False
+        if board is not None:
+            board.observers.append(self)
+
+    def on_update(self, board):
+        """Called by Board.simulate after each timestep."""
+        if board.t % self.every:
+            return
+        now = time.perf_counter()
+        if self.fps and now - self.last_draw < 1 / self.fps:
+            return
+        self.last_draw = now
+        self.draw(self.board_frame(board))
+
+    def board_frame(self, board):
+        """A Frame of the board's current arrays, not copied, holding only the pheromone of self.layer."""
+        state = board.ant_state
+        food = board.get_food_pheromone_grid() if self.layer == "food" else None
+        home = board.get_home_pheromone_grid() if self.layer == "home" else None
+        return Frame(board.t, food, home, state.y, state.x, state.direction, state.has_food,
+                     board.food.locations(), board.colony, board.colonies, board.grid.blocked)
+
+    def view_shape(self, height, width):
+        """The rows and columns of the board shown: all of it, or as much as fits."""
+        size = shutil.get_terminal_size()
+        rows = self.height or max(size.lines - 1, 1)
+        columns = self.width or size.columns
+        return min(height, rows), min(width, columns)
+
+    def render(self, frame):
+        """Builds the frame into the buffer. Returns the bytes which redraw what changed since the last frame."""
+        pheromone = frame.food_pheromone if self.layer == "food" else frame.home_pheromone
+        if self.buffer is None or self.buffer.shape != self.view_shape(*pheromone.shape):
+            rows, columns = self.view_shape(*pheromone.shape)
+            self.buffer = np.empty((rows, columns), dtype=np.uint8)
+            self.index = np.empty((rows, columns), dtype=np.uint8)
+            self.scaled = np.empty((rows, columns), dtype=np.float64)
+            self.previous = None
+        rows, columns = self.buffer.shape
+        buffer = self.buffer
+
+        view = pheromone[:rows, :columns]
+        low, high = float(view.min()), float(view.max())
+        if high > low:
+            np.subtract(view, low, out=self.scaled)
+            np.multiply(self.scaled, (len(self.RAMP) - 1) / (high - low), out=self.scaled)
+            np.copyto(self.index, self.scaled, casting="unsafe")
+        else:
+            self.index[...] = 0
+        np.take(self.RAMP, self.index, out=buffer)
+
+        if frame.blocked is not None:
+            buffer[frame.blocked[:rows, :columns]] = self.OBSTACLE
+        y, x = np.asarray(frame.ant_y), np.asarray(frame.ant_x)
+        inside = (y < rows) & (x < columns)
+        buffer[y[inside], x[inside]] = self.ANT_GLYPHS[np.asarray(frame.ant_direction)[inside]]
+        for locations, glyph in ((frame.colonies, self.COLONY), (frame.food_locs, self.FOOD)):
+            locations = np.asarray(locations, dtype=np.int64).reshape(-1, 2)
+            inside = (locations[:, 0] < rows) & (locations[:, 1] < columns)
+            buffer[locations[inside, 0], locations[inside, 1]] = glyph
+
+        status = f"t={frame.t}  {self.layer} pheromone {low:.3g} to {high:.3g}"
+        parts = [b"\x1b[1;1H" + status[:columns].ljust(columns).encode()]
+        if self.previous is None:
+            # hide the cursor and clear the screen before the first full frame
+            parts.insert(0, b"\x1b[?25l\x1b[2J")
+            changed = range(rows)
+            self.previous = buffer.copy()
+        else:
+            changed = np.flatnonzero((buffer != self.previous).any(axis=1)).tolist()
+            np.copyto(self.previous, buffer)
+        for row in changed:
+            parts.append(b"\x1b[%d;1H" % (row + 2) + buffer[row].tobytes())
+        return b"".join(parts)
+
+    def draw(self, frame):
+        """Draws a Frame to the stream."""
+        self.write(self.render(frame))
+        self.drawn_t = frame.t
+
+    def write(self, data):
+        stream = getattr(self.stream, "buffer", self.stream)
+        stream.write(data)
+        self.stream.flush()
+
+    def close(self):
+        """Draws the board's last timestep if it was skipped, then shows the cursor again below the board. The board stops being drawn."""
+        if self.closed:
+            return
+        self.closed = True
+        board = self.board
+        if board is not None:
+            if self in board.observers:
+                board.observers.remove(self)
+            if self.drawn_t != board.t:
+                self.draw(self.board_frame(board))
+        if self.buffer is not None:
+            self.write(b"\x1b[%d;1H\x1b[?25h\n" % (self.buffer.shape[0] + 2))
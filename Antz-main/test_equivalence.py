@@ -0,0 +1,88 @@
+"""
+The equivalences the engines, decay modes, checkpoints, replays and decomposition promise,
+each checked bit for bit on a small seeded board. Run with python -m pytest from Antz-main.
+"""
+from main import Board
+from parameters import Parameters
+from decomposition import StripDecomposition
+from replay import Replay, ReplayWriter
+import numpy as np
+import pytest
+
+BOARD = dict(width=20, height=20, num_ants=12, num_food=3, spawn_radius=4, seed=7)
+
+def state(board):
+    """Everything the simulation carries from one timestep to the next, up to date."""
+    board.grid.synchronize()
+    ants = board.ant_state
+    return {
+        "t": board.t, "num_activated": board.num_activated,
+        "food_pheromone": board.grid.food_layers.tobytes(), "home_pheromone": board.grid.home_layers.tobytes(),
+        "is_occupied": board.grid.is_occupied.tobytes(), "has_food": board.grid.has_food.tobytes(),
+        "ants": [getattr(ants, name).tolist() for name in ("y", "x", "direction", "has_food", "activated")],
+        "counts": board.recorder.counts.to_array().tolist(), "events": board.recorder.events.to_array().tolist(),
+        "stream": board.stream.position, "rng": board.rng.bit_generator.state,
+    }
+
+@pytest.mark.parametrize("kwargs", [{}, {"colonies": [(4, 4), (15, 15)]}, {"dtype": np.float32}])
+def test_sequential_batched_engine_matches_reference(kwargs):
+    reference = Board(**BOARD, **kwargs)
+    batched = Board(**BOARD, **kwargs, engine="batched", sequential=True)
+    reference.simulate(400)
+    batched.simulate(400)
+    assert state(batched) == state(reference)
+    assert reference.recorder.total(1) > 0
+
+@pytest.mark.parametrize("engine", [{}, {"engine": "batched", "sequential": True}, {"engine": "batched"}])
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_lazy_decay_matches_eager(engine, dtype):
+    eager = Board(**BOARD, **engine, dtype=dtype)
+    lazy = Board(**BOARD, **engine, dtype=dtype, lazy_decay=True)
+    for piece in range(3):
+        eager.simulate(150)
+        lazy.simulate(150)
+        assert state(lazy) == state(eager)
+
+@pytest.mark.parametrize("kwargs", [{}, {"engine": "batched"}, {"engine": "batched", "sequential": True, "lazy_decay": True},
+                                    {"food_quantity": 3, "respawn": "random", "respawn_delay": 20}])
+def test_checkpoint_resume_matches_uninterrupted_run(tmp_path, kwargs):
+    path = str(tmp_path / "board.npz")
+    straight = Board(**BOARD, **kwargs)
+    straight.simulate(500)
+    interrupted = Board(**BOARD, **kwargs)
+    interrupted.simulate(213)
+    interrupted.save_checkpoint(path)
+    resumed = Board.load_checkpoint(path)
+    resumed.simulate(287)
+    assert state(resumed) == state(straight)
+
+@pytest.mark.parametrize("kwargs", [{}, {"colonies": [(4, 4), (15, 15)], "engine": "batched"}, {"params": Parameters(diffusion_rate=0.2)}])
+def test_replay_frames_match_the_board(tmp_path, kwargs):
+    path = str(tmp_path / "run.rpl")
+    board = Board(**BOARD, **kwargs)
+    with ReplayWriter(path, board, keyframe_every=50):
+        board.simulate(180, snapshot_every=15)
+    replay = Replay(path)
+    # frames read out of order, so some start from a keyframe and some from the timestep before
+    for snapshot in sorted(board.snapshots, key=lambda frame: frame.t % 4):
+        frame = replay.frame(snapshot.t)
+        assert np.array_equal(frame.food_pheromone, snapshot.food_pheromone)
+        assert np.array_equal(frame.home_pheromone, snapshot.home_pheromone)
+        for name in ("ant_y", "ant_x", "ant_direction", "ant_has_food"):
+            assert np.array_equal(getattr(frame, name), getattr(snapshot, name))
+        assert sorted(map(tuple, frame.food_locs)) == sorted(map(tuple, snapshot.food_locs))
+
+@pytest.mark.parametrize("workers, kwargs", [(2, {}), (3, {"lazy_decay": True}), (4, {"dtype": np.float32})])
+def test_strip_decomposition_matches_parallel_engine(workers, kwargs):
+    parallel = Board(**BOARD, **kwargs, engine="batched")
+    decomposed = Board(**BOARD, **kwargs, engine="batched")
+    # starting part way through a block of the random stream
+    parallel.simulate(37)
+    decomposed.simulate(37)
+    parallel.simulate(200)
+    StripDecomposition(decomposed, workers).simulate(200)
+    assert state(decomposed) == state(parallel)
+    # and the board carries on as the parallel engine after the workers are gone
+    parallel.simulate(50)
+    decomposed.simulate(50)
+    assert state(decomposed) == state(parallel)
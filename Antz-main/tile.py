@@ -1,18 +1,145 @@
 import math
+import numpy as np
 
-class Tile:
-    
-    def __init__(self, x_coord, y_coord, a_f = math.e, b_f = 5, c_f = -5, a_h = math.e, b_h = 5, c_h = -5,):
-        
+DECAY_MODELS = ("multiplicative", "exponential")
+
+def multiplicative_decay(pheromone, rate, floor):
+    """In place, pheromone = max(pheromone * rate, floor) for every tile."""
+    np.multiply(pheromone, rate, out=pheromone)
+    np.maximum(pheromone, floor, out=pheromone)
+
+def exponential_decay(pheromone, a, b, c, initial, scratch):
+    """
+    In place, pheromone = max(initial, pheromone - a**(pheromone - c) / b) for every tile,
+    leaving tiles which still sit at the initial level untouched. 'scratch' is a work array
+    of the same shape, so no temporaries the size of the grid are allocated.
+    """
+    np.subtract(pheromone, c, out=scratch)
+    with np.errstate(over="ignore"):
+        np.power(a, scratch, out=scratch)
+    np.divide(scratch, b, out=scratch)
+    np.copyto(scratch, 0, where=(pheromone == initial))
+    np.subtract(pheromone, scratch, out=pheromone)
+    np.maximum(pheromone, initial, out=pheromone)
+
+def build_neighbor_table(height, width, directions, blocked = None):
+    """
+    Returns a (height * width, len(directions)) int32 table where entry [cell, d] is the id
+    (y * width + x) of the cell reached from 'cell' by directions[d], or -1 if that location is
+    off the board or blocked.
+    """
+    y, x = np.divmod(np.arange(height * width, dtype=np.int64), width)
+    table = np.full((height * width, len(directions)), -1, dtype=np.int32)
+    for d, (dy, dx) in enumerate(directions):
+        ny = y + dy
+        nx = x + dx
+        inside = (ny >= 0) & (ny < height) & (nx >= 0) & (nx < width)
+        table[inside, d] = ny[inside] * width + nx[inside]
+    if blocked is not None and blocked.any():
+        blocked = blocked.ravel()
+        table[table >= 0] = np.where(blocked[table[table >= 0]], -1, table[table >= 0])
+    return table
+
+def load_obstacles(source, height, width):
+    """
+    Returns a (height, width) boolean mask of blocked tiles from 'source': an array-like mask
+    (anything true is blocked), the path of a .npy file holding one, or the path of an image,
+    where dark pixels (luminance below one half) are blocked. Any of them is scaled to the
+    board by nearest neighbor if its size differs.
+    """
+    if isinstance(source, str) and source.endswith(".npy"):
+        source = np.load(source)
+    if isinstance(source, str):
+        import matplotlib.pyplot as plt
+        image = plt.imread(source).astype(np.float64)
+        if image.max() > 1:
+            image /= 255
+        if image.ndim == 3:
+            alpha = image[..., 3] if image.shape[2] == 4 else 1
+            image = (image[..., 0] * 0.299 + image[..., 1] * 0.587 + image[..., 2] * 0.114) * alpha + (1 - alpha)
+        mask = image < 0.5
+    else:
+        mask = np.asarray(source).astype(bool)
+    if mask.ndim != 2:
+        raise ValueError(f"An obstacle mask must be 2D, not of shape {mask.shape}.")
+    rows = np.arange(height) * mask.shape[0] // height
+    columns = np.arange(width) * mask.shape[1] // width
+    return mask[rows[:, None], columns[None, :]]
+
+class TileField:
+    """
+    Structure-of-arrays storage for every tile on a board.
+
+    Pheromone levels live in two contiguous float arrays and the tile flags in three boolean
+    arrays, all indexed by (y, x). The decay constants are shared by every tile, so they are
+    stored once here instead of on each Tile. Indexing the field returns Tile views.
+
+    With several colonies, each has its own pheromone: food_layers and home_layers are stacked
+    (colonies, height, width) arrays, decayed together, and food_pheromone / home_pheromone are
+    colony 0's layers. colony_map holds the colony of each colony tile and -1 elsewhere. The
+    pheromone accessors take the colony to read or write, 0 by default.
+
+    decay_model selects the decay applied by decay(): "multiplicative" (the default,
+    max(p * decay_rate, pheromone_floor)) or "exponential" (the older per-tile model built
+    on cur_*_pheromone_decay_pace).
+
+    With lazy_decay, decay() only advances a clock. Each tile remembers the clock value at
+    which it was last brought up to date, and its decayed level (max(p * decay_rate**elapsed,
+    pheromone_floor)) is computed when it is read, so a timestep costs nothing per tile.
+    synchronize() brings the whole grid up to date in one vectorized pass. A tile written since
+    the start is caught up one decay at a time, as jumping ahead by decay_rate**elapsed would
+    round differently from eager decay, so reads cost more than eager decay saves on smaller
+    boards. With 50 ants lazy decay was about 2x slower at 200x200 tiles, slightly slower at
+    1000x1000 (101 against 115 steps/s with the batched engine) and 1.5-3x faster at
+    2000x2000. It is off by default.
+
+    diffusion, None by default, is a diffusion.Diffusion which diffuse() applies to both
+    layer stacks. It touches every tile each timestep, so it is not used with lazy decay.
+    """
+    # up to this many stale tiles are caught up one by one in scalars rather than together in numpy
+    SCALAR_CATCH_UP = 32
+
+    def __init__(self, width, height, dtype = np.float64, decay_model = "multiplicative", lazy_decay = False,
+                 a_f = math.e, b_f = 5, c_f = -5,
+                 a_h = math.e, b_h = 5, c_h = -5,
+                 colonies = 1):
+        if decay_model not in DECAY_MODELS:
+            raise ValueError(f"Unknown decay model {decay_model!r}, expected one of {DECAY_MODELS}.")
+        if lazy_decay and decay_model != "multiplicative":
+            raise ValueError("Lazy decay is only available for the multiplicative decay model.")
+        self.width = width
+        self.height = height
         self.inital_pheromone = 5
-        self.x = x_coord
-        self.y = y_coord
+        self.decay_model = decay_model
+        self.decay_rate = 0.99
+        self.pheromone_floor = 0.1
+        self._scratch = None
+
+        # number of decay steps applied so far, and (lazy only) when each tile was last written
+        self.clock = 0
+        self.lazy_decay = lazy_decay
+        self.last_update = np.zeros((height, width), dtype=np.int64) if lazy_decay else None
+        self.on_initial_curve = np.ones((height, width), dtype=bool) if lazy_decay else None
+        self.epsilon = float(np.finfo(dtype).eps)
+        self._curve = None
 
-        self.home_pheromone = self.inital_pheromone 
-        self.food_pheromone = self.inital_pheromone 
-        self.has_food = False
-        self.is_colony = False
-        self.is_occupied = False
+        # tiles no ant can enter, see set_blocked
+        self.blocked = np.zeros((height, width), dtype=bool)
+        self.blocked_version = 0
+        self._neighbors = None
+
+        self.diffusion = None
+
+        # while a list, every set_pheromone call is appended to it as (code, index, value, colony), see replay.py
+        self.journal = None
+
+        self.colonies = colonies
+        self.home_layers = np.full((colonies, height, width), self.inital_pheromone, dtype=dtype)
+        self.food_layers = np.full((colonies, height, width), self.inital_pheromone, dtype=dtype)
+        self.has_food = np.zeros((height, width), dtype=bool)
+        self.is_colony = np.zeros((height, width), dtype=bool)
+        self.colony_map = np.full((height, width), -1, dtype=np.int16)
+        self.is_occupied = np.zeros((height, width), dtype=bool)
 
         #Decay function variables
         self.a_f = a_f
@@ -23,38 +150,352 @@ class Tile:
         self.b_h = b_h
         self.c_h = c_h
 
-    #Set home_pheromone level to a user specified value
-    def set_home_pheromone(self, new_pheromone):
-        self.home_pheromone = new_pheromone
+    def __getitem__(self, key):
+        """field[(y, x)] returns the Tile at that location, field[y][x] goes through a row."""
+        if isinstance(key, tuple):
+            return Tile(key[1], key[0], field=self)
+        return TileRow(self, key)
+
+    @property
+    def shape(self):
+        return (self.height, self.width)
+
+    @property
+    def home_pheromone(self):
+        """Colony 0's home pheromone, a (height, width) view."""
+        return self.home_layers[0]
+
+    @property
+    def food_pheromone(self):
+        """Colony 0's food pheromone, a (height, width) view."""
+        return self.food_layers[0]
+
+    def layers(self, code):
+        """The stacked home (code 1) or food (anything else) pheromone of every colony."""
+        return self.home_layers if code == 1 else self.food_layers
+
+    def add_colony(self, loc, colony = 0):
+        """Marks the tile at loc as the colony numbered 'colony'."""
+        self.is_colony[loc] = True
+        self.colony_map[loc] = colony
+
+    def __getstate__(self):
+        # the neighbor table, decay curve and scratch array are rebuilt on demand
+        state = self.__dict__.copy()
+        state["_neighbors"] = None
+        state["_curve"] = None
+        state["_scratch"] = None
+        state["journal"] = None
+        return state
+
+    def set_blocked(self, mask):
+        """Replaces the mask of blocked tiles. Always go through here so the neighbor table gets rebuilt."""
+        self.blocked = np.array(mask, dtype=bool).reshape(self.shape)
+        self.blocked_version += 1
+
+    def neighbor_table(self, directions):
+        """
+        The build_neighbor_table table for this field, built once and rebuilt automatically when
+        the geometry, the directions or the blocked mask change.
+        """
+        key = (self.height, self.width, tuple(directions), self.blocked_version)
+        if self._neighbors is None or self._neighbors[0] != key:
+            self._neighbors = (key, build_neighbor_table(self.height, self.width, directions, self.blocked))
+        return self._neighbors[1]
+
+    def get_pheromone(self, code, index, colony = 0):
+        """
+        Returns the current pheromone level at index (a (y, x) location or a tuple of index
+        arrays) of 'colony' (a number, or an array matching the index arrays). code 1 reads the
+        home pheromone, anything else the food pheromone.
+        """
+        self.synchronize(index)
+        if np.ndim(colony) == 0:
+            return self.layers(code)[colony][index]
+        return self.layers(code)[(colony,) + tuple(index)]
+
+    def set_pheromone(self, code, index, value, colony = 0):
+        """Sets the pheromone level of 'colony' at index. code 1 writes the home pheromone, anything else the food pheromone."""
+        if self.lazy_decay:
+            self.synchronize(index)
+            self.on_initial_curve[index] = False
+        if np.ndim(colony) == 0:
+            self.layers(code)[colony][index] = value
+        else:
+            self.layers(code)[(colony,) + tuple(index)] = value
+        if self.journal is not None:
+            self.journal.append((code, index, value, colony))
+
+    def deposit(self, code, index, amount, colony = 0):
+        """Adds amount to the pheromone of 'colony' at index. code 1 is the home pheromone, anything else the food pheromone."""
+        self.set_pheromone(code, index, self.get_pheromone(code, index, colony) + amount, colony)
+
+    def synchronize(self, index = Ellipsis):
+        """
+        With lazy decay, writes the decayed level of both layers back at index (by default the
+        whole grid) and marks those tiles as up to date. Does nothing for eager decay.
+
+        The result is bit-for-bit what eager decay would hold, so trajectories do not depend on
+        the mode: tiles never written since the start follow a precomputed curve, every other
+        stale tile is stepped with the eager kernel until it is current or sits at the floor.
+        """
+        if not self.lazy_decay:
+            return
+        if isinstance(index, tuple) and isinstance(index[0], (int, np.integer)):
+            self._synchronize_tile(index)
+            return
+        if index is Ellipsis:
+            cells = np.flatnonzero(self.last_update != self.clock)
+        else:
+            cells = np.ravel_multi_index(index, self.shape).ravel()
+            cells = cells[self.last_update.ravel()[cells] != self.clock]
+        if cells.size == 0:
+            return
+        last_update = self.last_update.reshape(-1)
+        on_curve = self.on_initial_curve.reshape(-1)[cells]
+        curve = self.initial_curve()
+        level = curve[min(self.clock, len(curve) - 1)]
+        stale = cells[~on_curve]
+        # every colony's layers share the tile's clock, so they are brought up to date together
+        for food, home in zip(self.food_layers.reshape(self.colonies, -1), self.home_layers.reshape(self.colonies, -1)):
+            food[cells[on_curve]] = level
+            home[cells[on_curve]] = level
+
+            remaining = self.clock - last_update[stale]
+            food_level = food[stale]
+            home_level = home[stale]
+            food_level[self.reaches_floor(food_level, remaining)] = self.pheromone_floor
+            home_level[self.reaches_floor(home_level, remaining)] = self.pheromone_floor
+            live = np.flatnonzero((food_level > self.pheromone_floor) | (home_level > self.pheromone_floor))
+            if live.size <= self.SCALAR_CATCH_UP:
+                for i in live.tolist():
+                    food_level[i], home_level[i] = self.catch_up(food_level[i], home_level[i], int(remaining[i]))
+                live = live[:0]
+            while live.size:
+                food_level[live] = np.maximum(food_level[live] * self.decay_rate, self.pheromone_floor)
+                home_level[live] = np.maximum(home_level[live] * self.decay_rate, self.pheromone_floor)
+                remaining[live] -= 1
+                live = live[(remaining[live] > 0) & ((food_level[live] > self.pheromone_floor) | (home_level[live] > self.pheromone_floor))]
+            food[stale] = food_level
+            home[stale] = home_level
+        last_update[cells] = self.clock
+        if index is Ellipsis:
+            last_update[:] = self.clock
+        else:
+            self.last_update[index] = self.clock
+
+    def _synchronize_tile(self, loc):
+        """synchronize() for a single (y, x) location, without building index arrays."""
+        elapsed = self.clock - self.last_update[loc]
+        if elapsed == 0:
+            return
+        if self.on_initial_curve[loc]:
+            curve = self.initial_curve()
+            level = curve[min(self.clock, len(curve) - 1)]
+            self.food_layers[(slice(None),) + loc] = level
+            self.home_layers[(slice(None),) + loc] = level
+        else:
+            for food, home in zip(self.food_layers, self.home_layers):
+                food_level = food[loc]
+                home_level = home[loc]
+                if self.reaches_floor(food_level, elapsed):
+                    food_level = self.pheromone_floor
+                if self.reaches_floor(home_level, elapsed):
+                    home_level = self.pheromone_floor
+                food[loc], home[loc] = self.catch_up(food_level, home_level, elapsed)
+        self.last_update[loc] = self.clock
+
+    def catch_up(self, food_level, home_level, elapsed):
+        """
+        The levels of one tile after 'elapsed' eager decays (fewer once both sit at the floor),
+        stepped one by one in scalars of the grid's dtype: Python floats for float64, which
+        round exactly as the eager kernel does but cost a fraction of a numpy operation.
+        """
+        dtype = self.food_layers.dtype
+        if dtype == np.float64:
+            food_level, home_level = float(food_level), float(home_level)
+            rate, floor = float(self.decay_rate), float(self.pheromone_floor)
+        else:
+            rate, floor = dtype.type(self.decay_rate), dtype.type(self.pheromone_floor)
+        for _ in range(elapsed):
+            if food_level <= floor and home_level <= floor:
+                break
+            food_level = max(food_level * rate, floor)
+            home_level = max(home_level * rate, floor)
+        return food_level, home_level
+
+    def reaches_floor(self, level, elapsed):
+        """
+        True where 'elapsed' eager decays certainly take 'level' down to the floor. The closed
+        form level * decay_rate**elapsed is compared with a margin covering the rounding
+        error of the iterated multiply, so this never disagrees with eager decay.
+        """
+        margin = (elapsed + 4) * self.epsilon
+        return level * self.decay_rate ** elapsed * (1 + margin) < self.pheromone_floor
+
+    def initial_curve(self):
+        """
+        The eager decay of an untouched tile: entry k is the level after k decays, and the
+        last entry is the floor it stays at from then on.
+        """
+        key = (self.decay_rate, self.pheromone_floor)
+        if self._curve is None or self._curve[0] != key:
+            level = np.full(1, self.inital_pheromone, dtype=self.food_pheromone.dtype)
+            curve = [level[0]]
+            while level[0] > self.pheromone_floor:
+                level = np.maximum(level * self.decay_rate, self.pheromone_floor)
+                curve.append(level[0])
+            self._curve = (key, np.array(curve, dtype=self.food_pheromone.dtype))
+        return self._curve[1]
+
+    def decay(self):
+        """
+        Applies one timestep of pheromone decay to every tile, one array operation per layer
+        stack (covering every colony). With lazy decay only the clock advances.
+        """
+        self.clock += 1
+        if self.lazy_decay:
+            return
+        if self.decay_model == "exponential":
+            if self._scratch is None:
+                self._scratch = np.empty_like(self.food_layers)
+            exponential_decay(self.food_layers, self.a_f, self.b_f, self.c_f, self.inital_pheromone, self._scratch)
+            exponential_decay(self.home_layers, self.a_h, self.b_h, self.c_h, self.inital_pheromone, self._scratch)
+        else:
+            multiplicative_decay(self.food_layers, self.decay_rate, self.pheromone_floor)
+            multiplicative_decay(self.home_layers, self.decay_rate, self.pheromone_floor)
+
+    def diffuse(self):
+        """Applies one timestep of diffusion to every colony's layers, if the field has a diffusion."""
+        if self.diffusion is None:
+            return
+        if self.lazy_decay:
+            raise ValueError("Diffusion is not available with lazy decay.")
+        self.diffusion(self.food_layers, self.blocked)
+        self.diffusion(self.home_layers, self.blocked)
+
+class TileRow:
+    """A single row of a TileField, so that field[y][x] keeps working."""
+    __slots__ = ("field", "y")
+
+    def __init__(self, field, y):
+        self.field = field
+        self.y = y
+
+    def __getitem__(self, x):
+        return Tile(x, self.y, field=self.field)
+
+class Tile:
+    """
+    A view onto a single cell of a TileField.
+
+    A tile created on its own (without a field) keeps its state in a private 1x1 field,
+    so it behaves exactly like the stand-alone Tile objects the board used to store.
+    """
+    __slots__ = ("x", "y", "field", "loc")
+
+    def __init__(self, x_coord, y_coord, a_f = math.e, b_f = 5, c_f = -5, a_h = math.e, b_h = 5, c_h = -5, field = None):
+        self.x = x_coord
+        self.y = y_coord
+
+        if field is None:
+            field = TileField(1, 1, a_f=a_f, b_f=b_f, c_f=c_f, a_h=a_h, b_h=b_h, c_h=c_h)
+            self.loc = (0, 0)
+        else:
+            self.loc = (y_coord, x_coord)
+        self.field = field
+
+    # Attribute access is forwarded to the field's arrays
+    @property
+    def home_pheromone(self):
+        return float(self.field.get_pheromone(1, self.loc))
+
+    @home_pheromone.setter
+    def home_pheromone(self, value):
+        self.field.set_pheromone(1, self.loc, value)
+
+    @property
+    def food_pheromone(self):
+        return float(self.field.get_pheromone(0, self.loc))
+
+    @food_pheromone.setter
+    def food_pheromone(self, value):
+        self.field.set_pheromone(0, self.loc, value)
 
-    #Set food_pheromone level to a user specified value
-    def set_food_pheromone(self, new_pheromone):
-        self.food_pheromone = new_pheromone
+    @property
+    def has_food(self):
+        return bool(self.field.has_food[self.loc])
+
+    @has_food.setter
+    def has_food(self, value):
+        self.field.has_food[self.loc] = value
+
+    @property
+    def is_colony(self):
+        return bool(self.field.is_colony[self.loc])
+
+    @is_colony.setter
+    def is_colony(self, value):
+        self.field.is_colony[self.loc] = value
+        self.field.colony_map[self.loc] = 0 if value else -1
+
+    # The colony this tile is the anthill of, or -1
+    @property
+    def colony(self):
+        return int(self.field.colony_map[self.loc])
+
+    @property
+    def is_occupied(self):
+        return bool(self.field.is_occupied[self.loc])
+
+    @is_occupied.setter
+    def is_occupied(self, value):
+        self.field.is_occupied[self.loc] = value
+
+    # The decay constants are shared by the whole field
+    @property
+    def inital_pheromone(self):
+        return self.field.inital_pheromone
+
+    a_f = property(lambda self: self.field.a_f)
+    b_f = property(lambda self: self.field.b_f)
+    c_f = property(lambda self: self.field.c_f)
+    a_h = property(lambda self: self.field.a_h)
+    b_h = property(lambda self: self.field.b_h)
+    c_h = property(lambda self: self.field.c_h)
+
+    #Set home_pheromone level (of a colony's layer) to a user specified value
+    def set_home_pheromone(self, new_pheromone, colony = 0):
+        self.field.set_pheromone(1, self.loc, new_pheromone, colony)
+
+    #Set food_pheromone level (of a colony's layer) to a user specified value
+    def set_food_pheromone(self, new_pheromone, colony = 0):
+        self.field.set_pheromone(0, self.loc, new_pheromone, colony)
 
     #Set has_food to a user specified value
     def set_has_food(self, new_state):
         self.has_food = new_state
-    
+
     #Set is_colony to a user specified value
     def set_is_colony(self, new_state):
         self.is_colony = new_state
-    
+
     # Set is_occupied to a user specified value
     def set_is_occupied(self, new_state):
         self.is_occupied = new_state
-    
-    # Returns home_pheromone level
-    def get_home_pheromone(self):
-        return self.home_pheromone
-    
-    # Returns food_pheromone level
-    def get_food_pheromone(self):
-        return self.food_pheromone
+
+    # Returns home_pheromone level (of a colony's layer)
+    def get_home_pheromone(self, colony = 0):
+        return float(self.field.get_pheromone(1, self.loc, colony))
+
+    # Returns food_pheromone level (of a colony's layer)
+    def get_food_pheromone(self, colony = 0):
+        return float(self.field.get_pheromone(0, self.loc, colony))
 
     # Returns has_food
     def get_has_food(self):
         return self.has_food
-    
+
     # Returns is_colony
     def get_is_colony(self):
         return self.is_colony
@@ -62,27 +503,29 @@ class Tile:
     # Returns is_occupied
     def get_is_occupied(self):
         return self.is_occupied
-    
+
     # Perform pheromone decay for food pheromone
     def cur_food_pheromone_decay_pace(self):
         if self.food_pheromone == self.inital_pheromone :
-            return 0 
+            return 0
         else:
             return ((self.a_f)**(self.food_pheromone-self.c_f))/self.b_f
-    
+
     # Perform pheromone decay for home pheromone
     def cur_home_pheromone_decay_pace(self):
         if self.home_pheromone == self.inital_pheromone :
-            return 0 
+            return 0
         else:
             return ((self.a_h)**(self.home_pheromone-self.c_h))/self.b_h
 
-    # Perform tile behavior for a single time instance
+    # Perform tile behavior for a single time instance (the board decays all tiles at once with TileField.decay)
     def update(self):
-        # self.food_pheromone = max(self.inital_pheromone , self.food_pheromone - self.cur_food_pheromone_dacay_pace())
-        # self.home_pheromone = max(self.inital_pheromone , self.home_pheromone - self.cur_home_pheromone_dacay_pace())
-        self.food_pheromone = max(self.food_pheromone*0.99, 0.1)
-        self.home_pheromone = max(self.home_pheromone*0.99, 0.1)
+        if self.field.decay_model == "exponential":
+            self.food_pheromone = max(self.inital_pheromone , self.food_pheromone - self.cur_food_pheromone_decay_pace())
+            self.home_pheromone = max(self.inital_pheromone , self.home_pheromone - self.cur_home_pheromone_decay_pace())
+        else:
+            self.food_pheromone = max(self.food_pheromone*self.field.decay_rate, self.field.pheromone_floor)
+            self.home_pheromone = max(self.home_pheromone*self.field.decay_rate, self.field.pheromone_floor)
 
     # Return tile as a string
     def __str__(self):
@@ -95,14 +538,16 @@ class Tile:
         else:
             return str(round(self.food_pheromone))
 
-    # Return has_food or is_colony depending on code
-    def get_check_method(self, code):
+    # Return has_food or is_colony depending on code (with a colony, whether this is that colony's tile)
+    def get_check_method(self, code, colony = None):
         if code == 1:
             return self.get_has_food()
-        return self.get_is_colony()
-    
-    # Return food_pheremone level or home_pheremone level depending on code
-    def get_pheromone_method(self, code):
+        if colony is None:
+            return self.get_is_colony()
+        return self.colony == colony
+
+    # Return food_pheremone level or home_pheremone level (of a colony's layer) depending on code
+    def get_pheromone_method(self, code, colony = 0):
         if code == 1:
-            return self.get_home_pheromone()
-        return self.get_food_pheromone()
+            return self.get_home_pheromone(colony)
+        return self.get_food_pheromone(colony)